@@ -1,16 +1,23 @@
 #!/usr/bin/python3
 
 from enum import Enum, unique
+import hashlib
+import json
 import os
 import sys
 import re
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Generator, List, Optional, Tuple, Union
 import cmdln
 from collections import namedtuple
 from collections import OrderedDict
 from osclib.cache import Cache
-from osclib.comments import CommentAPI
+from osclib.cache_manager import CacheManager
+from osclib.comments import BatchedCommentAPI, CommentAPI
 from osclib.conf import Config
 from osclib.core import action_is_patchinfo
 from osclib.core import devel_project_fallback
@@ -30,6 +37,7 @@ from lxml import etree as ET
 from osc import conf
 import osc.core
 from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
 
 from itertools import count
 
@@ -67,6 +75,80 @@ class PackageLookup(object):
             return None
 
 
+class VerdictCache(object):
+    """ persistent verdicts of a bot keyed by request id
+
+    An entry is only valid as long as the fingerprint of the request matches
+    and it is not older than max_age seconds.
+    """
+
+    def __init__(self, filename, max_age):
+        self.filename = filename
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as fh:
+                self.entries = json.load(fh)
+
+    def get(self, reqid, fingerprint):
+        entry = self.entries.get(reqid)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        if time.time() - entry['time'] > self.max_age:
+            return None
+        return entry
+
+    def put(self, reqid, fingerprint, verdict, review_messages):
+        with self.lock:
+            self.entries[reqid] = {
+                'fingerprint': fingerprint,
+                'time': time.time(),
+                'verdict': verdict,
+                'review_messages': review_messages,
+            }
+
+    def save(self):
+        with self.lock:
+            expired = time.time() - self.max_age
+            self.entries = {k: v for k, v in self.entries.items() if v['time'] >= expired}
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.filename), delete=False) as fh:
+                json.dump(self.entries, fh, default=str)
+            os.rename(fh.name, self.filename)
+
+
+class RequestContextAttribute(object):
+    """Attribute holding state of the request currently being checked.
+
+    While a request context is active (see ReviewBot.request_context()) the
+    value is local to the thread checking the request, otherwise it is a plain
+    attribute shared by the bot.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        context = obj.__dict__.get('_request_context')
+        if context is not None and getattr(context, 'active', False) and self.name in context.values:
+            return context.values[self.name]
+
+        try:
+            return obj.__dict__.setdefault('_request_shared', {})[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, obj, value):
+        context = obj.__dict__.get('_request_context')
+        if context is not None and getattr(context, 'active', False):
+            context.values[self.name] = value
+        else:
+            obj.__dict__.setdefault('_request_shared', {})[self.name] = value
+
+
 @unique
 class ReviewChoices(Enum):
     NORMAL = 'normal'
@@ -94,6 +176,14 @@ class ReviewBot(object):
 
     COMMENT_MARKER_REGEX = re.compile(r'<!-- (?P<bot>[^ ]+) state=(?P<state>[^ ]+)(?: result=(?P<result>[^ ]+))? -->')
 
+    # state of the request being checked, see request_context()
+    request = RequestContextAttribute()
+    action = RequestContextAttribute()
+    review_messages = RequestContextAttribute()
+    multiple_actions = RequestContextAttribute()
+    comment_handler = RequestContextAttribute()
+    verdict_cacheable = RequestContextAttribute()
+
     # map of default config entries
     config_defaults = {
         # list of tuples (prefix, apiurl, submitrequestprefix)
@@ -104,6 +194,7 @@ class ReviewBot(object):
         ]}
 
     def __init__(self, apiurl=None, dryrun=False, logger=None, user=None, group=None):
+        self._request_context = threading.local()
         self.apiurl = apiurl
         self.ibs = apiurl.startswith('https://api.suse.de')
         self.dryrun = dryrun
@@ -125,6 +216,10 @@ class ReviewBot(object):
         self.request_age_min_default = 0
         self.request_age_min_key = '{}-request-age-min'.format(self.bot_name.lower())
         self.lookup = PackageLookup(self.apiurl)
+        # number of requests checked concurrently
+        self.jobs = 1
+        self.verdict_cache = None
+        self._review_lock = threading.Lock()
 
         self.load_config()
 
@@ -184,10 +279,115 @@ class ReviewBot(object):
             req.read(root)
             self.requests.append(req)
 
+    def set_request_ids_review(self, ids):
+        """Like set_request_ids(), but only keep requests with an open review for us."""
+        self.requests = []
+        for rqid in ids:
+            u = osc.core.makeurl(self.apiurl, ['request', rqid], {'withfullhistory': '1'})
+            try:
+                root = ET.parse(osc.core.http_GET(u)).getroot()
+            except HTTPError as e:
+                self.logger.error('ERROR in URL %s [%s]' % (u, e))
+                continue
+
+            if root.find('state').get('name') != 'review':
+                continue
+            if not ((self.review_user and self._has_open_review_by(root, 'by_user', self.review_user)) or
+                    (self.review_group and self._has_open_review_by(root, 'by_group', self.review_group))):
+                continue
+
+            req = osc.core.Request()
+            req.read(root)
+            self.requests.append(req)
+
     # function called before requests are reviewed
     def prepare_review(self):
         pass
 
+    @contextmanager
+    def request_context(self, values=None):
+        """Keep the per-request attributes local to the current thread.
+
+        Attributes not set within the context fall back to the shared value,
+        except for review_messages which starts as a copy to be modified.
+        """
+        if values is None:
+            values = {'review_messages': self.review_messages.copy()}
+        context = self._request_context
+        context.values = values
+        context.active = True
+        try:
+            yield context.values
+        finally:
+            context.active = False
+            context.values = {}
+
+    def request_context_values(self):
+        """Copy of the values of the active request context, if any."""
+        context = self._request_context
+        if not getattr(context, 'active', False):
+            return {}
+        return dict(context.values)
+
+    def concurrent_checks_supported(self):
+        """Whether requests can be checked concurrently, see --jobs.
+
+        Bots opt in once all state of a check is kept in the request context
+        and nothing depends on process wide state like the working directory.
+        """
+        return False
+
+    def verdict_cache_enable(self, max_age):
+        """Skip requests unchanged since they were checked less than max_age seconds ago."""
+        host = urlparse(self.apiurl).hostname
+        reviewer = self.review_user or self.review_group
+        filename = os.path.join(CacheManager.directory('review-verdict', host),
+                                '{}-{}.json'.format(self.bot_name, reviewer))
+        self.verdict_cache = VerdictCache(filename, max_age)
+
+    def request_fingerprint(self, req):
+        """Hash of the request state a check depends on.
+
+        Covers the source and target revisions of all actions, the review
+        states and the bot configuration. If overrides are allowed it also
+        covers the description and the comments not written by bots, which
+        may hold override commands.
+        """
+        data = {
+            'bot': self.bot_name,
+            'config': self.config._asdict(),
+            'review_mode': self.review_mode.value,
+            'state': req.state.name,
+            'reviews': sorted([r.by_user, r.by_group, r.by_project, r.by_package, r.state]
+                              for r in req.reviews),
+            'actions': [],
+        }
+        for a in req.actions:
+            src_project = getattr(a, 'src_project', None)
+            src_package = getattr(a, 'src_package', None)
+            src_rev = getattr(a, 'src_rev', None)
+            tgt_project = getattr(a, 'tgt_project', None)
+            tgt_package = getattr(a, 'tgt_package', None)
+
+            if src_project and src_package and not src_rev:
+                info = self.get_sourceinfo(src_project, src_package)
+                src_rev = info.srcmd5 if info else None
+
+            tgt_rev = None
+            if tgt_project and tgt_package:
+                info = self.get_sourceinfo(tgt_project, tgt_package)
+                tgt_rev = info.srcmd5 if info else None
+
+            data['actions'].append([a.type, src_project, src_package, src_rev, tgt_project, tgt_package, tgt_rev])
+
+        if self.override_allow:
+            comments = self.comment_api.get_comments(request_id=req.reqid)
+            data['comments'] = sorted(c['id'] for c in comments.values()
+                                      if not self.comment_api.COMMENT_MARKER_REGEX.match(c['comment'] or ''))
+            data['description'] = req.description
+
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
     def check_requests(self):
         self.staging_apis = {}
 
@@ -195,44 +395,109 @@ class ReviewBot(object):
         self.prepare_review()
         return_value = 0
 
-        for req in self.requests:
-            self.logger.info("checking %s" % req.reqid)
-            self.request = req
-
-            # XXX: this is a hack. Annotating the request with staging_project.
-            # OBS itself should provide an API for that but that's currently not the case
-            # https://github.com/openSUSE/openSUSE-release-tools/pull/2377
-            if not hasattr(req, 'staging_project'):
-                staging_project = None
-                for r in req.reviews:
-                    if r.state == 'new' and r.by_project and ":Staging:" in r.by_project:
-                        staging_project = r.by_project
-                        break
-                setattr(req, 'staging_project', staging_project)
+        if isinstance(self.comment_api, BatchedCommentAPI):
+            self.comment_api.prefetch([{'request_id': req.reqid} for req in self.requests])
 
-            try:
-                good = self.check_one_request(req)
-            except Exception:
-                good = None
-
-                import traceback
-                traceback.print_exc()
-                return_value = 1
-
-            if self.review_mode == ReviewChoices.NO:
-                good = None
-            elif self.review_mode == ReviewChoices.ACCEPT:
-                good = True
-
-            if good is None:
-                self.logger.info("%s ignored" % req.reqid)
-            elif good:
-                self._set_review(req, 'accepted')
-            elif self.review_mode != ReviewChoices.ACCEPT_ONPASS:
-                self._set_review(req, 'declined')
+        if self.jobs > 1 and len(self.requests) > 1:
+            return_value = self.check_requests_concurrently()
+        else:
+            for req in self.requests:
+                good, success = self._check_request(req)
+                if not success:
+                    return_value = 1
+                self._review_request(req, good)
+
+        if self.verdict_cache is not None:
+            self.verdict_cache.save()
+
+        if isinstance(self.comment_api, BatchedCommentAPI):
+            self.comment_api.flush()
 
         return return_value
 
+    def check_requests_concurrently(self):
+        """Check the requests with a pool of self.jobs threads.
+
+        Each request is checked within its own request context. The reviews are
+        set one after another in the order of self.requests to keep the outcome
+        independent of the scheduling.
+        """
+        def work(req):
+            with self.request_context() as values:
+                good, success = self._check_request(req)
+                if isinstance(self.comment_handler, CommentFromLogHandler):
+                    self.comment_handler_remove()
+                return good, success, dict(values)
+
+        return_value = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [(req, executor.submit(work, req)) for req in self.requests]
+            for req, future in futures:
+                good, success, values = future.result()
+                if not success:
+                    return_value = 1
+                with self._review_lock, self.request_context(values):
+                    self._review_request(req, good)
+
+        return return_value
+
+    def _check_request(self, req):
+        """Check a single request.
+
+        Returns the result of check_one_request() and False as second value if
+        the check raised an exception.
+        """
+        self.logger.info("checking %s" % req.reqid)
+        self.request = req
+
+        # XXX: this is a hack. Annotating the request with staging_project.
+        # OBS itself should provide an API for that but that's currently not the case
+        # https://github.com/openSUSE/openSUSE-release-tools/pull/2377
+        if not hasattr(req, 'staging_project'):
+            staging_project = None
+            for r in req.reviews:
+                if r.state == 'new' and r.by_project and ":Staging:" in r.by_project:
+                    staging_project = r.by_project
+                    break
+            setattr(req, 'staging_project', staging_project)
+
+        fingerprint = None
+        if self.verdict_cache is not None:
+            fingerprint = self.request_fingerprint(req)
+            cached = self.verdict_cache.get(req.reqid, fingerprint)
+            if cached is not None:
+                self.logger.info("%s unchanged since last check" % req.reqid)
+                self.review_messages = cached['review_messages']
+                return cached['verdict'], True
+
+        # checks depending on something else than the request itself, like
+        # the age of the request, must reset this
+        self.verdict_cacheable = True
+        try:
+            good = self.check_one_request(req)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            return None, False
+
+        if fingerprint is not None and self.verdict_cacheable:
+            self.verdict_cache.put(req.reqid, fingerprint, good, dict(self.review_messages))
+
+        return good, True
+
+    def _review_request(self, req, good):
+        if self.review_mode == ReviewChoices.NO:
+            good = None
+        elif self.review_mode == ReviewChoices.ACCEPT:
+            good = True
+
+        if good is None:
+            self.logger.info("%s ignored" % req.reqid)
+        elif good:
+            self._set_review(req, 'accepted')
+        elif self.review_mode != ReviewChoices.ACCEPT_ONPASS:
+            self._set_review(req, 'declined')
+
     @memoize(session=True)
     def request_override_check_users(self, project: str) -> List[str]:
         """Determine users allowed to override review in a comment command."""
@@ -847,6 +1112,8 @@ class ReviewBot(object):
         if age < age_min:
             self.logger.info('skipping {} of age {:.2f}s since it is younger than {}s'.format(
                 request.reqid, age, age_min))
+            # the verdict changes with time alone
+            self.verdict_cacheable = False
             return True
 
         return False
@@ -856,8 +1123,12 @@ class CommentFromLogHandler(logging.Handler):
     def __init__(self, level=logging.INFO):
         super(CommentFromLogHandler, self).__init__(level)
         self.lines = []
+        # only collect messages of the request checked by the creating thread
+        self.thread = threading.get_ident()
 
     def emit(self, record):
+        if record.thread != self.thread:
+            return
         self.lines.append(record.getMessage())
 
 
@@ -880,6 +1151,12 @@ class CommandLineInterface(cmdln.Cmdln):
         parser.add_option("--fallback-user", dest='fallback_user', metavar='USER', help="fallback review user")
         parser.add_option("--fallback-group", dest='fallback_group', metavar='GROUP', help="fallback review group")
         parser.add_option('-c', '--config', dest='config', metavar='FILE', help='read config file FILE')
+        parser.add_option('-j', '--jobs', type='int', default=1, metavar='N',
+                          help='check N requests concurrently, if supported by the bot')
+        parser.add_option('--verdict-cache-max-age', type='int', metavar='MINUTES',
+                          help='skip requests that did not change since checked at most MINUTES ago')
+        parser.add_option('--batch-comments', action='store_true',
+                          help='prefetch request comments and write them after all requests are checked')
 
         return parser
 
@@ -911,6 +1188,16 @@ class CommandLineInterface(cmdln.Cmdln):
         if self.options.fallback_group:
             self.checker.fallback_group = self.options.fallback_group
 
+        if self.options.jobs > 1 and not self.checker.concurrent_checks_supported():
+            raise osc.oscerr.WrongArgs('{} can not check requests concurrently'.format(self.checker.bot_name))
+        self.checker.jobs = self.options.jobs
+
+        if self.options.verdict_cache_max_age:
+            self.checker.verdict_cache_enable(self.options.verdict_cache_max_age * 60)
+
+        if self.options.batch_comments:
+            self.checker.comment_api = BatchedCommentAPI(self.checker.apiurl)
+
     def setup_checker(self):
         """ reimplement this """
         apiurl = conf.config['apiurl']
@@ -938,6 +1225,9 @@ class CommandLineInterface(cmdln.Cmdln):
         return self.checker.check_requests()
 
     @cmdln.option('-n', '--interval', metavar="minutes", type="int", help="periodic interval in minutes")
+    @cmdln.option('--listen', action='store_true', help='check requests on request events from the message bus, '
+                  'the interval is used for a full sweep (default 60 minutes)')
+    @cmdln.option('--amqp-prefix', metavar='PREFIX', help='message bus prefix (default based on apiurl)')
     def do_review(self, subcmd, opts, *args):
         """${cmd_name}: check requests that have the specified user or group as reviewer
 
@@ -951,6 +1241,9 @@ class CommandLineInterface(cmdln.Cmdln):
             self.checker.set_request_ids_search_review()
             return self.checker.check_requests()
 
+        if opts.listen:
+            return self.listener(work, opts.interval or 60, opts.amqp_prefix)
+
         return self.runner(work, opts.interval)
 
     @cmdln.option('-n', '--interval', metavar="minutes", type="int", help="periodic interval in minutes")
@@ -967,6 +1260,32 @@ class CommandLineInterface(cmdln.Cmdln):
 
         return self.runner(work, opts.interval)
 
+    def listener(self, workfunc, interval, amqp_prefix=None):
+        """ runs the specified callback every <interval> minutes and checks
+        requests announced on the message bus in between
+        """
+        # only needed in listen mode, so do not require pika otherwise
+        from osclib.review_listener import ReviewListener
+
+        def sweep():
+            memoize_session_reset()
+            self.postoptparse()
+            workfunc()
+
+        def check(ids):
+            memoize_session_reset()
+            self.checker.set_request_ids_review(ids)
+            self.checker.check_requests()
+
+        if not amqp_prefix:
+            amqp_prefix = 'suse' if self.checker.ibs else 'opensuse'
+
+        listener = ReviewListener(amqp_prefix, check, sweep, interval * 60, self.logger)
+        try:
+            listener.run()
+        except KeyboardInterrupt:
+            listener.stop()
+
     def runner(self, workfunc, interval):
         """ runs the specified callback every <interval> minutes or
         once if interval is None or 0
@@ -1,13 +1,17 @@
 #!/usr/bin/python3
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import difflib
 import glob
+import json
 import os
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 from typing import Optional, Set
 from cmdln import CmdlnOptionParser
 
@@ -15,6 +19,7 @@ from lxml import etree as ET
 
 import osc.conf
 import osc.core
+from osclib.checkout_store import CheckoutStore
 from osclib.conf import Config
 from osclib.core import devel_project_get
 from osclib.core import devel_project_fallback
@@ -31,10 +36,61 @@ import ReviewBot
 from osclib.conf import str2bool
 
 
+class ValidatorProcesses(object):
+    """Subprocesses of a validator which are terminated once it is cancelled."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processes = set()
+        self.cancelled = False
+
+    def run(self, args, **kwargs):
+        with self.lock:
+            if self.cancelled:
+                raise RuntimeError('validator cancelled')
+            process = subprocess.Popen(args, **kwargs)
+            self.processes.add(process)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    def terminate(self):
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes:
+                process.terminate()
+
+
 class CheckSource(ReviewBot.ReviewBot):
 
     SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 
+    # settings of the target project of the request being checked, see
+    # target_project_config()
+    single_action_require = ReviewBot.RequestContextAttribute()
+    ignore_devel = ReviewBot.RequestContextAttribute()
+    in_air_rename_allow = ReviewBot.RequestContextAttribute()
+    add_review_team = ReviewBot.RequestContextAttribute()
+    review_team = ReviewBot.RequestContextAttribute()
+    mail_release_list = ReviewBot.RequestContextAttribute()
+    staging_group = ReviewBot.RequestContextAttribute()
+    required_maintainer = ReviewBot.RequestContextAttribute()
+    devel_whitelist = ReviewBot.RequestContextAttribute()
+    skip_add_reviews = ReviewBot.RequestContextAttribute()
+    ensure_source_exist_in_baseproject = ReviewBot.RequestContextAttribute()
+    devel_baseproject = ReviewBot.RequestContextAttribute()
+    allow_source_in_sle = ReviewBot.RequestContextAttribute()
+    sle_project_to_check = ReviewBot.RequestContextAttribute()
+    allow_valid_source_origin = ReviewBot.RequestContextAttribute()
+    valid_source_origins = ReviewBot.RequestContextAttribute()
+    add_devel_project_review = ReviewBot.RequestContextAttribute()
+    allowed_scm_submission_sources = ReviewBot.RequestContextAttribute()
+    # subprocesses of the validator being run, see run_validators()
+    validator = ReviewBot.RequestContextAttribute()
+
     def __init__(self, *args, **kwargs):
         ReviewBot.ReviewBot.__init__(self, *args, **kwargs)
 
@@ -42,6 +98,13 @@ class CheckSource(ReviewBot.ReviewBot):
         self.request_default_return = True
 
         self.skip_add_reviews = False
+        self.checkout_store = None
+        self.validator_stats = None
+        self.validator = None
+
+    def concurrent_checks_supported(self):
+        # osc checks out into the working directory of the process
+        return self.checkout_store is not None
 
     def target_project_config(self, project: str) -> None:
         # Load project config and allow for remote entries.
@@ -230,23 +293,20 @@ class CheckSource(ReviewBot.ReviewBot):
             self.logger.warning('directory %s already exists' % copath)
             shutil.rmtree(copath)
         os.makedirs(copath)
-        os.chdir(copath)
+        if not self.checkout_store:
+            os.chdir(copath)
+        old = os.path.join(copath, '_old')
+        directory = os.path.join(copath, target_package)
 
         try:
-            CheckSource.checkout_package(self.apiurl, target_project, target_package, pathname=copath,
-                                         server_service_files=True, expand_link=True)
-            shutil.rmtree(os.path.join(target_package, '.osc'))
-            os.rename(target_package, '_old')
+            self.checkout_sources(target_project, target_package, old)
         except HTTPError as e:
             if e.code == 404:
                 self.logger.info('target package does not exist %s/%s' % (target_project, target_package))
             else:
                 raise e
 
-        CheckSource.checkout_package(self.apiurl, source_project, source_package, revision=source_revision,
-                                     pathname=copath, server_service_files=True, expand_link=True)
-        os.rename(source_package, target_package)
-        shutil.rmtree(os.path.join(target_package, '.osc'))
+        self.checkout_sources(source_project, source_package, directory, revision=source_revision)
 
         new_info = self.package_source_parse(source_project, source_package, source_revision, target_package)
         filename = new_info.get('filename', '')
@@ -259,27 +319,29 @@ class CheckSource(ReviewBot.ReviewBot):
                 target_package, expected_name, new_info['name'])
             return False
 
-        if not self.check_service_file(target_package):
-            return False
-
-        if not self.check_rpmlint(target_package):
+        # check_service_file() removes the _service file the others must not see
+        failed = self.run_validators(target_package, [
+            ('service_file', self.check_service_file, (directory,)),
+            ('rpmlint', self.check_rpmlint, (directory,)),
+        ], concurrent=False)
+        if failed:
             return False
 
-        specs = [os.path.basename(x) for x in glob.glob(os.path.join(target_package, "*.spec"))]
+        specs = [os.path.basename(x) for x in glob.glob(os.path.join(directory, "*.spec"))]
         if not specs:
             # package without spec files e.g kiwi only
             return True
 
-        if not self.check_spec_policy('_old', target_package, specs):
+        failed = self.run_validators(target_package, [
+            ('spec_policy', self.check_spec_policy, (old, directory, specs)),
+            ('source_validator', self.run_source_validator, (old, directory)),
+            ('mentioned_patches', self.detect_mentioned_patches, (old, directory, specs)),
+            ('urls', self.check_urls, (old, directory, specs)),
+        ])
+        if failed and failed != 'urls':
             return False
 
-        if not self.run_source_validator('_old', target_package):
-            return False
-
-        if not self.detect_mentioned_patches('_old', target_package, specs):
-            return False
-
-        if not self.check_urls('_old', target_package, specs):
+        if failed == 'urls':
             osc.core.change_review_state(apiurl=self.apiurl,
                                          reqid=self.request.reqid, newstate='new',
                                          by_group=self.review_group,
@@ -332,6 +394,78 @@ class CheckSource(ReviewBot.ReviewBot):
 
         return True
 
+    def run_validators(self, package, validators, concurrent=True):
+        """Run the (name, function, args) validators on the checkout.
+
+        The validators only read the checkout and run concurrently unless told
+        otherwise. As soon as one fails the others are cancelled and their
+        subprocesses terminated. The result is the name of the first failing
+        validator in the given order among those finished, whose review
+        messages are then set, or None.
+        """
+        # the validator threads see the state of the request checked here
+        values = self.request_context_values()
+        values['request'] = self.request
+
+        def run(function, args, review_messages, validator):
+            start = time.time()
+            with self.request_context(dict(values, review_messages=review_messages, validator=validator)):
+                result = function(*args)
+            return result, time.time() - start
+
+        executor = ThreadPoolExecutor(max_workers=len(validators) if concurrent else 1)
+        futures = {}
+        for name, function, args in validators:
+            review_messages = self.review_messages.copy()
+            validator = ValidatorProcesses()
+            future = executor.submit(run, function, args, review_messages, validator)
+            futures[future] = (name, review_messages, validator)
+
+        results = {}
+        try:
+            pending = set(futures)
+            while pending and all(results.values()):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, review_messages, validator = futures[future]
+                    result, duration = future.result()
+                    self.logger.info('validator {} took {:.2f}s'.format(name, duration))
+                    self.validator_stats_write(package, name, duration, bool(result))
+                    results[name] = result
+        finally:
+            for future, (name, review_messages, validator) in futures.items():
+                if not future.done():
+                    future.cancel()
+                    validator.terminate()
+            executor.shutdown(wait=False)
+
+        for name, review_messages, validator in futures.values():
+            if name in results and not results[name]:
+                self.review_messages.update(review_messages)
+                return name
+
+        return None
+
+    def validator_run(self, args, **kwargs):
+        """subprocess.run() terminated once the running validator is cancelled."""
+        if self.validator is None:
+            return subprocess.run(args, **kwargs)
+        return self.validator.run(args, **kwargs)
+
+    def validator_stats_write(self, package, name, duration, passed):
+        if not self.validator_stats:
+            return
+
+        with open(self.validator_stats, 'a') as fh:
+            fh.write(json.dumps({
+                'time': int(time.time()),
+                'request': self.request.reqid,
+                'package': package,
+                'validator': name,
+                'seconds': round(duration, 3),
+                'passed': passed,
+            }) + '\n')
+
     def is_devel_project(self, source_project, target_project):
         if source_project in self.devel_whitelist:
             return True
@@ -493,6 +627,21 @@ class CheckSource(ReviewBot.ReviewBot):
         else:
             return action.person_name == user and action.person_role == 'maintainer'
 
+    def checkout_sources(self, project, package, directory, revision=None):
+        """Check out the expanded sources of a package into directory.
+
+        Without the checkout store, osc needs directory to be below the current
+        working directory.
+        """
+        if self.checkout_store:
+            self.checkout_store.checkout(project, package, directory, revision=revision)
+            return
+
+        CheckSource.checkout_package(self.apiurl, project, package, revision=revision, pathname=os.getcwd(),
+                                     server_service_files=True, expand_link=True)
+        shutil.rmtree(os.path.join(package, '.osc'))
+        os.rename(package, directory)
+
     @staticmethod
     def checkout_package(*args, **kwargs):
         _stdout = sys.stdout
@@ -568,6 +717,7 @@ class CheckSource(ReviewBot.ReviewBot):
             result = osc.core.show_project_sourceinfo(self.apiurl, action.tgt_project, True, (action.tgt_package))
             root = ET.fromstring(result)
         except HTTPError:
+            self.verdict_cacheable = False
             return None
 
         # Decline the delete request if there is another delete/submit request against the same package
@@ -622,7 +772,8 @@ class CheckSource(ReviewBot.ReviewBot):
         for script in scripts:
             if os.path.isdir(script):
                 continue
-            res = subprocess.run([script, '--batchmode', directory, old], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            res = self.validator_run([script, '--batchmode', directory, old],
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             if res.returncode:
                 text = "Source validator failed. Try \"osc service runall source_validator\"\n"
                 text += res.stdout.decode('utf-8')
@@ -657,18 +808,24 @@ class CheckSource(ReviewBot.ReviewBot):
             os.rename(nspecfn, specfn)
 
     def check_urls(self, old, directory, specs):
-        self._snipe_out_existing_urls(old, directory, specs)
-        oldcwd = os.getcwd()
         with tempfile.TemporaryDirectory() as tmpdir:
-            os.chdir(directory)
-            res = subprocess.run(["/usr/lib/obs/service/download_files", "--enforceupstream",
-                                  "yes", "--enforcelocal", "yes", "--outdir", tmpdir], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            # other validators read the directory meanwhile so the spec files
+            # are rewritten within a linked copy
+            workdir = os.path.join(tmpdir, 'sources')
+            outdir = os.path.join(tmpdir, 'download')
+            os.mkdir(workdir)
+            os.mkdir(outdir)
+            for filename in os.listdir(directory):
+                os.symlink(os.path.abspath(os.path.join(directory, filename)), os.path.join(workdir, filename))
+            self._snipe_out_existing_urls(old, workdir, specs)
+
+            res = self.validator_run(["/usr/lib/obs/service/download_files", "--enforceupstream",
+                                      "yes", "--enforcelocal", "yes", "--outdir", outdir],
+                                     cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             if res.returncode:
                 self.review_messages['new'] = "Source URLs are not valid. Try `osc service runall download_files`.\n" + \
                     res.stdout.decode('utf-8')
-                os.chdir(oldcwd)
                 return False
-        os.chdir(oldcwd)
         return True
 
     def difflines(self, oldf, newf):
@@ -770,6 +927,10 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
 
         parser.add_option('--skip-add-reviews', action='store_true', default=False,
                           help='skip adding review after completing checks')
+        parser.add_option('--checkout-store-size', type='int', default=0, metavar='GB',
+                          help='size of the local store of source files, disabled by default')
+        parser.add_option('--validator-stats', metavar='FILE',
+                          help='append the duration of every validator run as JSON line to FILE')
 
         return parser
 
@@ -777,6 +938,9 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
         bot = ReviewBot.CommandLineInterface.setup_checker(self)
 
         bot.skip_add_reviews = self.options.skip_add_reviews
+        bot.validator_stats = self.options.validator_stats
+        if self.options.checkout_store_size:
+            bot.checkout_store = CheckoutStore(bot.apiurl, self.options.checkout_store_size * 1024 ** 3)
 
         return bot
 
@@ -77,6 +77,7 @@ class FactorySourceChecker(ReviewBot.ReviewBot):
             requests = get_request_list_with_history(apiurl, project, package, None, ['new', 'review'], 'submit')
         except (HTTPError, URLError):
             self.logger.error("caught exception while checking %s/%s", project, package)
+            self.verdict_cacheable = False
             return None
 
         def srref(reqid):
@@ -96,6 +97,7 @@ class FactorySourceChecker(ReviewBot.ReviewBot):
                     return True
                 if req.state.name != 'review':
                     self.logger.error("%s in state %s not expected", srref(req.reqid), req.state.name)
+                    self.verdict_cacheable = False
                     return None
 
                 self.logger.debug("%s still in review", srref(req.reqid))
@@ -124,6 +126,7 @@ class FactorySourceChecker(ReviewBot.ReviewBot):
                                              srref(req.reqid), r.by_project, r.by_package)
                         else:
                             self.logger.info("%s waiting for review by %s", srref(req.reqid), r.by_project)
+                    self.verdict_cacheable = False
                     return None
                 return True
 
@@ -191,6 +194,7 @@ by OBS on which this bot relies.
                 return True
 
             self.logger.debug('error loading diff, assume transient error')
+            self.verdict_cacheable = False
             return None
 
         xml = ET.parse(f)
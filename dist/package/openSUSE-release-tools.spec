@@ -253,6 +253,7 @@ Group:          Development/Tools/Other
 Requires:       %{name} = %{version}
 Requires:       osc >= 0.165.1
 Requires:       python3-osc
+Requires:       python3-solv
 BuildArch:      noarch
 
 %description -n osclib
@@ -121,6 +121,8 @@ def clean_args(args):
 @cmdln.option('--no-color', action='store_true', help='strip colors from output (or add staging.color = 0 to the .oscrc general section')
 @cmdln.option('--remove-exclusion', action='store_true', help='unignore selected requests automatically', default=False)
 @cmdln.option('--save', action='store_true', help='save the result to the pseudometa package')
+@cmdln.option('-j', '--jobs', type=int, default=1, metavar='JOBS',
+              help='select requests concurrently using JOBS threads, without progress output')
 def do_staging(self, subcmd, opts, *args):
     """${cmd_name}: Commands to work with staging projects
 
@@ -271,6 +273,10 @@ def do_staging(self, subcmd, opts, *args):
         select --remove-exclusion will unignore the requests selected (ignored requests
         are called excluded in the OBS API)
 
+        select -j JOBS selects the requests concurrently, which is only safe
+        for requests of different packages. Selects already running are not
+        stopped by the first failure.
+
     "unselect" will remove from the project - pushing them back to the backlog
         If a message is included the requests will be ignored first.
 
@@ -309,7 +315,7 @@ def do_staging(self, subcmd, opts, *args):
         osc staging unignore [--cleanup] [REQUEST...|all]
         osc staging list [--supersede]
         osc staging lock [-m MESSAGE]
-        osc staging select [--no-freeze] [--remove-exclusion] [--move [--filter-from STAGING]]
+        osc staging select [--no-freeze] [--remove-exclusion] [-j JOBS] [--move [--filter-from STAGING]]
             STAGING REQUEST...
         osc staging select [--no-freeze] [--interactive|--non-interactive]
             [--filter-by...] [--group-by...]
@@ -563,12 +569,12 @@ def do_staging(self, subcmd, opts, *args):
                     #    and that this staging is simply manual followup.
                     #    api.set_splitter_info_in_prj_pseudometa(target_project, info['group'], info['strategy'])
 
-                    SelectCommand(api, target_project) \
+                    SelectCommand(api, target_project, opts.jobs) \
                         .perform(request_ids, no_freeze=opts.no_freeze, remove_exclusion=opts.remove_exclusion)
             else:
                 target_project = api.prj_from_short(stagings[0])
                 filter_from = api.prj_from_short(opts.filter_from) if opts.filter_from else None
-                SelectCommand(api, target_project) \
+                SelectCommand(api, target_project, opts.jobs) \
                     .perform(requests, opts.move,
                              filter_from, no_freeze=opts.no_freeze, remove_exclusion=opts.remove_exclusion)
         elif cmd == 'cleanup_rings':
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 import time
 import re
 from urllib.error import HTTPError
@@ -16,6 +17,12 @@ from datetime import date
 
 
 class AcceptCommand(object):
+    # stagings cleaned up concurrently
+    JOBS = 8
+    # bounds in seconds of the delay between polling the accept progress
+    POLL_DELAY_MIN = 1
+    POLL_DELAY_MAX = 30
+
     def __init__(self, api):
         self.api = api
         self.config = conf.config[self.api.project]
@@ -91,29 +98,31 @@ class AcceptCommand(object):
         self.requests = {'delete': [], 'submit': []}
         staging_packages = {}
 
-        if accept_all_green:
-            projects = self.api.get_staging_projects()
-
-        bugowners_to_request = dict()
-        for prj in projects:
-            project = self.api.prj_from_letter(prj)
-
-            status = self.api.project_status(project)
-            if status.get('state') != 'acceptable':
-                if accept_all_green:
-                    continue
-                if not force:
-                    print('The project "{}" is not yet acceptable.'.format(project))
-                    return False
-
-            staging_packages[project] = []
-            for request in status.findall('staged_requests/request'):
-                type = request.get('type')
-                if type in self.requests:
-                    self.requests[type].append(request.get('package'))
-                if type == 'submit':
-                    self.check_request_for_bugowner(bugowners_to_request, request.get('package'), request.get('id'))
-                staging_packages[project].append(request.get('package'))
+        # one status call for all stagings
+        with self.api.staging_snapshot(status=True):
+            if accept_all_green:
+                projects = self.api.get_staging_projects()
+
+            bugowners_to_request = dict()
+            for prj in projects:
+                project = self.api.prj_from_letter(prj)
+
+                status = self.api.project_status(project)
+                if status.get('state') != 'acceptable':
+                    if accept_all_green:
+                        continue
+                    if not force:
+                        print('The project "{}" is not yet acceptable.'.format(project))
+                        return False
+
+                staging_packages[project] = []
+                for request in status.findall('staged_requests/request'):
+                    type = request.get('type')
+                    if type in self.requests:
+                        self.requests[type].append(request.get('package'))
+                    if type == 'submit':
+                        self.check_request_for_bugowner(bugowners_to_request, request.get('package'), request.get('id'))
+                    staging_packages[project].append(request.get('package'))
 
         other_new = self.find_new_requests(self.api.project)
         for req in other_new:
@@ -134,32 +143,24 @@ class AcceptCommand(object):
             u = self.api.makeurl(['staging', self.api.project, 'staging_projects', project, 'accept'], opts)
             http_POST(u)
             self.api.switch_flag_in_prj(project, flag='build', state='disable', repository='images')
+        self.api.snapshot_invalidate()
 
         for req in other_new:
             print(f"Accepting request {req['id']}: {req['package']}")
             change_request_state(self.api.apiurl, str(req['id']), 'accepted', message='Accept to %s' % self.api.project)
 
-        for project in sorted(staging_packages.keys()):
-            print(f'waiting for staging project {project} to be accepted')
-
-            while True:
-                status = self.api.project_status(project, reload=True)
-                if status.get('state') == 'empty':
-                    break
-                print('{} requests still staged - waiting'.format(status.find('staged_requests').get('count')))
-                time.sleep(1)
-
-            self.api.accept_status_comment(project, staging_packages[project])
-            if self.api.is_adi_project(project):
-                self.api.delete_empty_adi_project(project)
-                continue
-
-            self.pkglist_comments.check_staging_accept(project, self.api.project)
-            self.api.staging_deactivate(project)
-            self.reset_rebuild_data(project)
-
-            if cleanup:
-                self.cleanup(project)
+        # finish stagings one after another as soon as they are accepted, the
+        # package list commit is not safe to run concurrently, while the
+        # finished ones are cleaned up in the background, one package delete
+        # per staging at a time
+        with ThreadPoolExecutor(max_workers=self.JOBS) as executor:
+            futures = []
+            for project in self.wait_for_accept(staging_packages.keys()):
+                if self.staging_accepted(project, staging_packages[project]) and cleanup:
+                    futures.append(executor.submit(self.cleanup, project))
+            # raise any error
+            for future in futures:
+                future.result()
 
         for package in self.requests['submit']:
             self.fix_linking_packages(package)
@@ -177,6 +178,46 @@ class AcceptCommand(object):
 
         return True
 
+    def wait_for_accept(self, projects):
+        """Yield the staging projects once they are empty.
+
+        The status of all stagings is polled at once with a delay growing
+        while no staging finishes.
+        """
+        pending = set(projects)
+        delay = self.POLL_DELAY_MIN
+        while True:
+            status = self.api.project_status(None, reload=True)
+            stagings = {staging.get('name'): staging for staging in status.findall('staging_project')}
+            for project in sorted(pending):
+                staging = stagings.get(project)
+                if staging is None or staging.get('state') == 'empty':
+                    pending.remove(project)
+                    delay = self.POLL_DELAY_MIN
+                    yield project
+
+            if not pending:
+                break
+
+            for project in sorted(pending):
+                staged = stagings[project].find('staged_requests')
+                count = staged.get('count') if staged is not None else '?'
+                print(f'{count} requests still staged in {project} - waiting')
+            time.sleep(delay)
+            delay = min(delay * 2, self.POLL_DELAY_MAX)
+
+    def staging_accepted(self, project, packages):
+        """Finish an accepted staging, return if it is left for cleanup."""
+        self.api.accept_status_comment(project, packages)
+        if self.api.is_adi_project(project):
+            self.api.delete_empty_adi_project(project)
+            return False
+
+        self.pkglist_comments.check_staging_accept(project, self.api.project)
+        self.api.staging_deactivate(project)
+        self.reset_rebuild_data(project)
+        return True
+
     def cleanup(self, project):
         if not self.api.item_exists(project):
             return
@@ -184,9 +225,9 @@ class AcceptCommand(object):
         pkglist = self.api.list_packages(project)
         clean_list = set(pkglist) - set(self.api.cnocleanup_packages)
 
-        for package in clean_list:
-            print("[cleanup] deleted %s/%s" % (project, package))
+        for package in sorted(clean_list):
             delete_package(self.api.apiurl, project, package, force=True, msg="autocleanup")
+            print("[cleanup] deleted %s/%s" % (project, package))
 
         return
 
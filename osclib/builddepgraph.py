@@ -0,0 +1,171 @@
+import glob
+import json
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from urllib.parse import urlparse
+
+from osclib.cache_manager import CacheManager
+
+# Build dependency graph of a repository as reported by _builddepinfo.
+#
+# The XML is ingested once per repository state into integer indexed
+# adjacency arrays in compressed sparse row layout with forward and reverse
+# edges. The graph is persisted in the cache so other tools and later runs do
+# not fetch and parse the document again until the repository changes.
+#
+# Use osclib.core.builddepgraph() to get the graph of a repository, this
+# module does not talk to OBS itself.
+
+MAGIC = b'OSRTBDG2'
+HEADER = struct.Struct('<Q')
+ARRAYS = ('forward_offsets', 'forward_targets', 'reverse_offsets', 'reverse_targets')
+
+
+def _csr(count, edges):
+    offsets = array('I', [0] * (count + 1))
+    for source, _ in edges:
+        offsets[source + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    targets = array('I', [0] * len(edges))
+    position = array('I', offsets[:-1])
+    for source, target in edges:
+        targets[position[source]] = target
+        position[source] += 1
+    return offsets, targets
+
+
+class BuildDepGraph(object):
+    def __init__(self, names, cycles, arrays):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.cycles_ = cycles
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_builddepinfo(cls, root):
+        names = []
+        dependencies = []
+        for package in root.findall('package'):
+            names.append(package.get('name'))
+            dependencies.append([pkgdep.text for pkgdep in package.findall('pkgdep')])
+        index = {name: i for i, name in enumerate(names)}
+
+        edges = set()
+        for source, targets in enumerate(dependencies):
+            for target in targets:
+                if target in index:
+                    edges.add((source, index[target]))
+        edges = sorted(edges)
+
+        arrays = {}
+        arrays['forward_offsets'], arrays['forward_targets'] = _csr(len(names), edges)
+        arrays['reverse_offsets'], arrays['reverse_targets'] = _csr(len(names), sorted((t, s) for s, t in edges))
+
+        cycles = []
+        for cycle in root.findall('cycle'):
+            cycles.append([index[package.text] for package in cycle.findall('package') if package.text in index])
+        return cls(names, cycles, arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('invalid build dependency graph {}'.format(filename))
+            length, = HEADER.unpack(f.read(HEADER.size))
+            header = json.loads(f.read(length).decode('utf-8'))
+            arrays = {}
+            for name in ARRAYS:
+                arrays[name] = array('I')
+                arrays[name].frombytes(f.read(header['lengths'][name] * arrays[name].itemsize))
+        return cls(header['names'], header['cycles'], arrays)
+
+    def save(self, filename):
+        header = json.dumps({
+            'names': self.names,
+            'cycles': self.cycles_,
+            'lengths': {name: len(getattr(self, name)) for name in ARRAYS},
+        }).encode('utf-8')
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), delete=False) as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(len(header)))
+            f.write(header)
+            for name in ARRAYS:
+                f.write(getattr(self, name).tobytes())
+        os.rename(f.name, filename)
+
+    def _ids(self, packages):
+        if packages is None:
+            return range(len(self.names))
+        if isinstance(packages, str):
+            packages = [packages]
+        return [self.index[package] for package in packages if package in self.index]
+
+    def depends_on(self, packages=None, reverse=False):
+        """
+        Direct build dependencies of packages, or the packages build depending
+        on them if reverse, like the pkgnames and revpkgnames views.
+        """
+        if reverse:
+            offsets, targets = self.reverse_offsets, self.reverse_targets
+        else:
+            offsets, targets = self.forward_offsets, self.forward_targets
+        result = set()
+        for i in self._ids(packages):
+            result.update(self.names[t] for t in targets[offsets[i]:offsets[i + 1]])
+        return result
+
+    def cycles(self):
+        """The cycles as reported by OBS as lists of package names."""
+        return [[self.names[i] for i in cycle] for cycle in self.cycles_]
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def cached_graph(apiurl, project, repository, arch, state, fetch):
+    """
+    Return the BuildDepGraph of a repository in state, loaded from the cache
+    if it was ingested before and otherwise built from the _builddepinfo root
+    returned by fetch().
+    """
+    key = (apiurl, project, repository, arch, state)
+    with _graphs_lock:
+        if state is not None and key in _graphs:
+            return _graphs[key]
+
+    if state is None:
+        # no binaries, so nothing worth to persist
+        return BuildDepGraph.from_builddepinfo(fetch())
+
+    directory = CacheManager.directory('builddepgraph', urlparse(apiurl).hostname, project, repository, arch)
+    filename = os.path.join(directory, '{}.graph'.format(state))
+    graph = None
+    if os.path.exists(filename):
+        try:
+            graph = BuildDepGraph.load(filename)
+        except ValueError:
+            pass
+    if graph is None:
+        graph = BuildDepGraph.from_builddepinfo(fetch())
+        for oldfile in glob.glob(glob.escape(directory) + '/*.graph'):
+            if oldfile == filename:
+                continue
+            try:
+                os.unlink(oldfile)
+            except FileNotFoundError:
+                # removed by a concurrent caller
+                pass
+        graph.save(filename)
+
+    with _graphs_lock:
+        # only the latest state of a repository is kept
+        for other in [other for other in _graphs if other[:4] == key[:4]]:
+            del _graphs[other]
+        _graphs[key] = graph
+    return graph
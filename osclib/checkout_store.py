@@ -0,0 +1,141 @@
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+from lxml import etree as ET
+import osc.core
+from urllib.error import HTTPError
+
+from osclib.cache_manager import CacheManager
+
+# Materialize package checkouts from a local store of source files keyed by
+# the md5 OBS reports per file. Files shared between target and source, or
+# between revisions of a request, are only downloaded once and checkouts are
+# hardlinked from the store. Stored files are read-only so that a checkout
+# can not modify them in place.
+
+
+class CheckoutStore(object):
+    # default size budget in bytes
+    BUDGET = 10 * 1024 ** 3
+    # share of the budget left after an eviction, so the store is not walked
+    # again for every following checkout
+    PRUNE_TARGET = 0.9
+
+    def __init__(self, apiurl, budget=BUDGET, directory=None):
+        self.apiurl = apiurl
+        self.budget = budget
+        self.directory = directory or CacheManager.directory('checkout-store')
+        self.lock = threading.Lock()
+        # total size of the stored files, determined on first use and then
+        # tracked as files are added
+        self.size = None
+
+    def files(self, project, package, revision=None, expand_link=True):
+        """Return the srcmd5 and (name, md5) pairs of a package revision."""
+        try:
+            meta = osc.core.show_files_meta(self.apiurl, project, package, revision=revision, expand=expand_link)
+        except HTTPError as e:
+            # same fallback as osc checkout uses for links that do not apply
+            if not expand_link or e.code != 400:
+                raise e
+            meta = osc.core.show_files_meta(self.apiurl, project, package, revision=revision,
+                                            expand=True, linkrev='base')
+
+        root = ET.fromstring(meta)
+        return root.get('srcmd5'), [(entry.get('name'), entry.get('md5')) for entry in root.findall('entry')]
+
+    def path(self, md5):
+        return os.path.join(self.directory, md5[:2], md5)
+
+    def fetch(self, project, package, srcmd5, filename, md5):
+        path = self.path(md5)
+        if os.path.exists(path):
+            # mtime serves as last use for the eviction
+            os.utime(path, None)
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=md5 + '.', suffix='.tmp')
+        os.close(fd)
+        osc.core.get_source_file(self.apiurl, project, package, filename, targetfilename=tmp, revision=srcmd5)
+
+        digest = hashlib.md5()
+        with open(tmp, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != md5:
+            os.unlink(tmp)
+            raise Exception('md5 mismatch for {}/{}/{}'.format(project, package, filename))
+
+        os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(tmp, path)
+        with self.lock:
+            if self.size is not None:
+                self.size += os.path.getsize(path)
+        return path
+
+    def checkout(self, project, package, pathname, revision=None, expand_link=True):
+        """Place the files of a package revision into pathname.
+
+        Like osc.core.checkout_package(), but without the .osc metadata.
+        """
+        srcmd5, files = self.files(project, package, revision, expand_link)
+
+        os.makedirs(pathname)
+        for filename, md5 in files:
+            source = self.fetch(project, package, srcmd5, filename, md5)
+            destination = os.path.join(pathname, filename)
+            try:
+                os.link(source, destination)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                    raise e
+                shutil.copyfile(source, destination)
+
+        self.prune()
+
+    def entries(self):
+        """Return the (mtime, size, path) of the stored files."""
+        entries = []
+        for directory, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    # evicted by another process
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def prune(self):
+        """Evict least recently used files until the store fits the budget.
+
+        The store is only walked on first use and once the tracked size
+        exceeds the budget.
+        """
+        with self.lock:
+            if self.size is not None and self.size <= self.budget:
+                return
+
+            entries = self.entries()
+            self.size = sum(size for _, size, _ in entries)
+            if self.size <= self.budget:
+                return
+
+            target = self.budget * self.PRUNE_TARGET
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+                if self.size <= target:
+                    break
@@ -1,4 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import threading
+import time
 from typing import TYPE_CHECKING, Any, Dict, Generator, List, Optional, Tuple, Union
 try:
     from typing import Literal, TypedDict
@@ -295,3 +298,128 @@ class CommentAPI(object):
         for comment in self.get_comments(request_id, project_name, package_name).values():
             if comment['who'] == user:
                 self.delete(comment['id'])
+
+
+class BatchedCommentAPI(CommentAPI):
+    """CommentAPI caching comments and deferring modifications.
+
+    Comments of many requests, projects or packages can be fetched at once
+    using prefetch() and are kept for CACHE_TTL seconds. add_comment() and
+    delete() are queued until flush() and are reflected in the cached comments
+    meanwhile. Replacing a comment by an identical one is dropped from the
+    queue without any request to OBS.
+    """
+
+    CACHE_TTL = 5 * 60
+    JOBS = 8
+
+    def __init__(self, apiurl, jobs=JOBS):
+        super(BatchedCommentAPI, self).__init__(apiurl)
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        # target key -> (time fetched, comments)
+        self.cache = {}
+        # target key -> list of ('delete', comment id) and ('add', pending id, add_comment() kwargs)
+        self.queue = {}
+        # comment id -> comment queued for deletion
+        self.deleted = {}
+        self.pending_id = 0
+
+    @staticmethod
+    def _key(request_id=None, project_name=None, package_name=None):
+        return (str(request_id) if request_id else None, project_name, package_name)
+
+    def _fetch(self, key):
+        comments = super(BatchedCommentAPI, self).get_comments(*key)
+        with self.lock:
+            self.cache[key] = (time.time(), comments)
+        return comments
+
+    def prefetch(self, targets):
+        """Fetch comments of the targets, dicts of get_comments() arguments, concurrently."""
+        keys = set(self._key(**target) for target in targets)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(self._fetch, keys))
+
+    def get_comments(self, request_id=None, project_name=None,
+                     package_name=None) -> Dict[str, Comment]:
+        key = self._key(request_id, project_name, package_name)
+        with self.lock:
+            cached = self.cache.get(key)
+            # modified comments must not expire before being flushed
+            if cached and (key in self.queue or time.time() - cached[0] < self.CACHE_TTL):
+                return dict(cached[1])
+        return dict(self._fetch(key))
+
+    def add_comment(self, request_id=None, project_name=None,
+                    package_name=None, comment=None, parent_id=None):
+        if not comment:
+            raise ValueError('Empty comment.')
+
+        key = self._key(request_id, project_name, package_name)
+        text = self.truncate(comment.strip()).encode('ascii', 'ignore').decode('ascii')
+        self.get_comments(*key)
+
+        with self.lock:
+            operations = self.queue.setdefault(key, [])
+            for operation in operations:
+                if operation[0] != 'delete':
+                    continue
+                deleted = self.deleted[operation[1]]
+                if deleted['comment'] == text and deleted['parent'] == parent_id:
+                    # identical to the comment about to be replaced
+                    operations.remove(operation)
+                    self.cache[key][1][deleted['id']] = self.deleted.pop(deleted['id'])
+                    return None
+
+            self.pending_id += 1
+            comment_id = 'pending-{}'.format(self.pending_id)
+            operations.append(('add', comment_id, {
+                'request_id': request_id, 'project_name': project_name, 'package_name': package_name,
+                'comment': comment, 'parent_id': parent_id}))
+            self.cache[key][1][comment_id] = {
+                'who': None, 'when': datetime.now(), 'id': comment_id, 'parent': parent_id, 'comment': text}
+        return None
+
+    def delete(self, comment_id):
+        with self.lock:
+            key = None
+            for cached_key, (_, comments) in self.cache.items():
+                if comment_id in comments:
+                    key = cached_key
+                    break
+
+            if key is None:
+                # not fetched through this instance
+                self.queue.setdefault(None, []).append(('delete', comment_id))
+                return None
+
+            comment = self.cache[key][1].pop(comment_id)
+            operations = self.queue.setdefault(key, [])
+            if comment_id.startswith('pending-'):
+                operations[:] = [o for o in operations if o[1] != comment_id]
+            else:
+                self.deleted[comment_id] = comment
+                operations.append(('delete', comment_id))
+        return None
+
+    def _flush_operations(self, operations):
+        for operation in operations:
+            if operation[0] == 'delete':
+                super(BatchedCommentAPI, self).delete(operation[1])
+            else:
+                super(BatchedCommentAPI, self).add_comment(**operation[2])
+
+    def flush(self):
+        """Send the queued modifications to OBS."""
+        with self.lock:
+            queue = self.queue
+            self.queue = {}
+            self.deleted = {}
+            for key in queue:
+                # drop cached comments to pick up the ids assigned by OBS
+                self.cache.pop(key, None)
+
+        # the operations of a target are ordered, the targets are independent
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            list(executor.map(self._flush_operations, [o for o in queue.values() if len(o)]))
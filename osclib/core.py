@@ -16,7 +16,6 @@ from urllib.error import HTTPError
 from osc.core import ReviewState, create_submit_request
 from osc.core import get_binarylist
 from osc.core import get_commitlog
-from osc.core import get_dependson
 from osc.connection import http_DELETE
 from osc.connection import http_GET
 from osc.connection import http_POST
@@ -32,6 +31,7 @@ from osc.core import show_results_meta
 from osc.core import xpath_join
 from osc.util.helper import decode_it
 from osc import conf
+from osclib.builddepgraph import cached_graph
 from osclib.conf import Config
 from osclib.memoize import memoize
 import traceback
@@ -207,8 +207,8 @@ def target_archs(apiurl, project, repository='standard'):
 def depends_on(apiurl, project, repository, packages=None, reverse=None):
     dependencies = set()
     for arch in target_archs(apiurl, project, repository):
-        root = ET.fromstring(get_dependson(apiurl, project, repository, arch, packages, reverse))
-        dependencies.update(pkgdep.text for pkgdep in root.findall('.//pkgdep'))
+        graph = builddepgraph(apiurl, project, repository, arch)
+        dependencies.update(graph.depends_on(packages, reverse))
 
     return dependencies
 
@@ -320,11 +320,22 @@ def devel_project_fallback(apiurl, target_project, target_package):
 
 
 @memoize(session=True)
+def devel_project_index(apiurl, project):
+    """Map all packages of project with a devel project to it like devel_project_get()."""
+    index = {}
+
+    root = search(apiurl, 'package', "@project='{}' and devel/@project!=''".format(project))
+    for package in root.findall('package'):
+        devel = package.find('devel')
+        index[package.get('name')] = (devel.get('project'), devel.get('package'))
+
+    return index
+
+
 def devel_projects(apiurl, project):
     devel_projects = set()
 
-    root = search(apiurl, 'package', "@project='{}' and devel/@project!=''".format(project))
-    for devel_project in root.xpath('package/devel/@project'):
+    for devel_project, _ in devel_project_index(apiurl, project).values():
         if devel_project != project:
             devel_projects.add(devel_project)
 
@@ -390,6 +401,12 @@ def builddepinfo(apiurl, project, repo, arch, order=False):
     return ET.parse(http_GET(url)).getroot()
 
 
+def builddepgraph(apiurl, project, repo, arch):
+    """BuildDepGraph of builddepinfo() for the current state of the repository, cached across runs."""
+    state = repository_arch_state(apiurl, project, repo, arch)
+    return cached_graph(apiurl, project, repo, arch, state, lambda: builddepinfo(apiurl, project, repo, arch))
+
+
 def entity_email(apiurl, key, entity_type='person', include_name=False):
     url = makeurl(apiurl, [entity_type, key])
     root = ET.parse(http_GET(url)).getroot()
@@ -0,0 +1,416 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import subprocess
+import tempfile
+import zlib
+
+# Native replacement for the findfileconflicts script.
+#
+# Every mirrored repository gets a file index next to its rpms which is only
+# rebuilt when the repository content changes. The index holds the package
+# metadata needed to rule out conflicts and two sorted tables of path hashes,
+# one for the files and one for the directories below which a package owns
+# files. Both are memory-mapped and binary searched, so a check only probes
+# the files of the target packages instead of building the complete path map
+# of all repositories.
+#
+# The rules follow findfileconflicts, including usrmerge, the ghost handling
+# and implicit conflicts of files with directories of other packages.
+
+SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+
+MAGIC = b'OSRTFCI1'
+HEADER = struct.Struct('<QQQ')
+FILE_RECORD = struct.Struct('<QII')
+DIR_RECORD = struct.Struct('<QI')
+
+DIR_MODE = '40755 0 root:root'
+USRMERGE_DIRS = ('/bin', '/sbin', '/lib', '/lib64')
+# packages shipping the compat symlinks of usrmerge
+USRMERGE_HELPERS = ('glibc-usrmerge-bootstrap-helper', 'bash-legacybin')
+
+FILE_TYPES = {0o01: 'p', 0o02: 'c', 0o04: 'd', 0o06: 'b', 0o10: '-', 0o12: 'l', 0o14: 's'}
+
+
+class CorruptRepository(Exception):
+    pass
+
+
+def path_hash(path):
+    return int.from_bytes(hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def mode_type(mode):
+    return int(mode.split(' ', 1)[0], 8) & 0o7770000
+
+
+def mode_ghost(mode):
+    return int(mode.split(' ', 2)[1], 8) & 0o100
+
+
+def beautify_mode(mode):
+    m = mode.split(' ', 2)
+    fm = int(m[0], 8)
+    ft = FILE_TYPES.get(fm >> 12 & 0o77, '?')
+    fm &= ~0o770000
+
+    rt = int(m[1], 8)
+    rts = ''
+    for flag, char in ((0o2, 'd'), (0o1, 'c'), (0o10, 'm'), (0o20, 'n'), (0o100, 'g'), (0o200, 'l'), (0o400, 'r')):
+        if rt & flag:
+            rts += char
+    rt &= ~0o733
+    if rt:
+        rts += '{:o}'.format(rt)
+    if rts:
+        rts += ' '
+    return '{}{}{:03o} {}'.format(rts, ft, fm, m[2])
+
+
+def usrmerged(path):
+    for directory in USRMERGE_DIRS:
+        if path == directory or path.startswith(directory + '/'):
+            return '/usr' + path
+    return path
+
+
+def path_variants(path, usrmerge):
+    """Return the spellings of a (usrmerged) path as found in the indexes."""
+    if not usrmerge:
+        return [path]
+    variants = [path]
+    for directory in USRMERGE_DIRS:
+        if path == '/usr' + directory or path.startswith('/usr' + directory + '/'):
+            variants.append(path[4:])
+    return variants
+
+
+def parse_packages(lines):
+    """
+    Parse the susetags packages file written by write_repo_susetags_file.pl.
+
+    Yields a dict per package with the fields findfileconflicts looks at.
+    """
+    package = None
+    section = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if section:
+            if line == '-' + section + ':':
+                section = None
+            elif section == 'Flx':
+                if package['name'] not in USRMERGE_HELPERS:
+                    file_entry(package, line)
+            elif section in ('Prv', 'Con', 'Obs'):
+                name = line.split(' ', 1)[0]
+                if section == 'Con':
+                    name = re.sub(r'^otherproviders\((.*)\)$', r'\1', name)
+                package[section].append(name)
+            continue
+
+        if line.startswith('=Pkg: '):
+            if package:
+                yield package
+            name, version, release, arch = line[6:].split(' ')[:4]
+            package = {'name': name, 'version': version, 'release': release, 'arch': arch,
+                       'source': 'unknown', 'files': [], 'Prv': [], 'Con': [], 'Obs': []}
+        elif line.startswith('=Src: ') and package:
+            package['source'] = line[6:].split(' ')[0]
+        elif line.startswith('+') and line.endswith(':') and package:
+            section = line[1:-1]
+    if package:
+        yield package
+
+
+def file_entry(package, line):
+    if package['name'] == 'filesystem':
+        match = re.match(r'^120777 0 root:root (/(?:s?bin|lib(?:64)?)) -> /?usr(/(?:s?bin|lib(?:64)?))$', line)
+        if match and match.group(1) == match.group(2):
+            package['usrmerge'] = True
+
+    link = ''
+    match = re.match(r'^(12.*)( -> .*?)$', line)
+    if match:
+        line, link = match.group(1), match.group(2)
+    match = re.match(r'^(\d+ (\d+) \S+) (.*/.*?)$', line)
+    if not match:
+        return
+    perms, path = match.group(1), match.group(3)
+    flag = int(match.group(2), 8)
+    if flag & 0o100:
+        # a ghost directory does not conflict due to the flag mismatch
+        if int(perms.split(' ', 1)[0], 8) & 0o7770000 == 0o40000:
+            flag ^= 0o100
+            perms = re.sub(r'^(\d+ )(\d+)', r'\g<1>{:o}'.format(flag), perms)
+        # ignore the link target and pretend a ghost file has normal mode
+        link = ''
+        perms = re.sub(r'^100000', '100644', perms)
+    package['files'].append((path, perms + link))
+
+
+class FileIndex(object):
+    """Memory-mapped file index of a single repository."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise CorruptRepository('invalid file index {}'.format(filename))
+
+        header_length, self.files_count, self.dirs_count = HEADER.unpack_from(self.mm, len(MAGIC))
+        offset = len(MAGIC) + HEADER.size
+        header = json.loads(self.mm[offset:offset + header_length].decode('utf-8'))
+        self.packages = header['packages']
+        self.modes = header['modes']
+        self.files_offset = offset + header_length
+        self.dirs_offset = self.files_offset + self.files_count * FILE_RECORD.size
+        self.blob_offset = self.dirs_offset + self.dirs_count * DIR_RECORD.size
+
+    @staticmethod
+    def write(filename, packages):
+        modes = {}
+        files = []
+        dirs = set()
+        blob = bytearray()
+        header = []
+        for index, package in enumerate(packages):
+            listing = []
+            for path, mode in package['files']:
+                mode_index = modes.setdefault(mode, len(modes))
+                files.append((path_hash(path), index, mode_index))
+                listing.append('{}\t{}'.format(path, mode_index))
+                parent = path
+                while parent.count('/') > 1:
+                    parent = parent[:parent.rindex('/')]
+                    dirs.add((path_hash(parent + '/'), index))
+
+            compressed = zlib.compress('\n'.join(listing).encode('utf-8'))
+            entry = {key: package[key] for key in ('name', 'version', 'release', 'arch', 'source')}
+            entry.update({'provides': package['Prv'], 'conflicts': package['Con'], 'obsoletes': package['Obs'],
+                          'files': [len(blob), len(compressed)]})
+            if package.get('usrmerge'):
+                entry['usrmerge'] = True
+            header.append(entry)
+            blob += compressed
+
+        files.sort()
+        dirs = sorted(dirs)
+        header = json.dumps({'packages': header, 'modes': sorted(modes, key=modes.get)}).encode('utf-8')
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), delete=False) as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(len(header), len(files), len(dirs)))
+            f.write(header)
+            for record in files:
+                f.write(FILE_RECORD.pack(*record))
+            for record in dirs:
+                f.write(DIR_RECORD.pack(*record))
+            f.write(blob)
+        os.rename(f.name, filename)
+
+    def _search(self, offset, count, record, key):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if record.unpack_from(self.mm, offset + mid * record.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        while lo < count:
+            entry = record.unpack_from(self.mm, offset + lo * record.size)
+            if entry[0] != key:
+                break
+            yield entry[1:]
+            lo += 1
+
+    def lookup(self, path):
+        """Return (package, mode) of the entries for path."""
+        return [(package, self.modes[mode])
+                for package, mode in self._search(self.files_offset, self.files_count, FILE_RECORD, path_hash(path))]
+
+    def owners_below(self, path):
+        """Return the packages owning files below the directory path."""
+        return [entry[0] for entry in self._search(self.dirs_offset, self.dirs_count, DIR_RECORD, path_hash(path + '/'))]
+
+    def files(self, package):
+        offset, length = self.packages[package]['files']
+        offset += self.blob_offset
+        listing = zlib.decompress(self.mm[offset:offset + length]).decode('utf-8')
+        for line in listing.split('\n') if listing else []:
+            path, mode = line.rsplit('\t', 1)
+            yield path, self.modes[int(mode)]
+
+    def catalog(self):
+        """Return the package names mapped to their source package."""
+        return {package['name']: package['source'] for package in self.packages}
+
+
+def file_index(directory):
+    """
+    Return the FileIndex of a mirrored repository directory, building it if
+    the repository content changed since it was last built.
+    """
+    key = hashlib.sha1()
+    rpms = sorted(glob.glob(glob.escape(directory) + '/*.rpm'))
+    for rpm in rpms:
+        key.update('{} {}\n'.format(os.path.basename(rpm), os.path.getsize(rpm)).encode('utf-8'))
+
+    cachedir = os.path.join(directory, '.cache')
+    filename = os.path.join(cachedir, 'fileconflicts-{}.idx'.format(key.hexdigest()))
+    if os.path.exists(filename):
+        return FileIndex(filename)
+
+    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
+        script = os.path.join(SCRIPT_PATH, '..', 'write_repo_susetags_file.pl')
+        p = subprocess.run(['perl', script, dir, directory])
+        if p.returncode:
+            raise CorruptRepository('failed to read {}'.format(directory))
+
+        os.makedirs(cachedir, exist_ok=True)
+        for oldfile in glob.glob(glob.escape(cachedir) + '/fileconflicts-*.idx'):
+            if oldfile == filename:
+                continue
+            try:
+                os.unlink(oldfile)
+            except FileNotFoundError:
+                # removed by a concurrent check
+                pass
+        with open(os.path.join(dir, 'packages')) as packages:
+            FileIndex.write(filename, parse_packages(packages))
+
+    return FileIndex(filename)
+
+
+class FileConflicts(object):
+    """
+    File conflicts of the packages of the first index with the packages of
+    all indexes. Packages of a name are only taken from the first index
+    providing that name.
+    """
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.considered = []
+        names = set()
+        for index in indexes:
+            considered = set()
+            for number, package in enumerate(index.packages):
+                if package['name'] not in names:
+                    considered.add(number)
+            names |= set(index.packages[number]['name'] for number in considered)
+            self.considered.append(considered)
+
+        self.usrmerge = False
+        for index, considered in zip(indexes, self.considered):
+            for number in considered:
+                if index.packages[number]['name'] == 'filesystem':
+                    self.usrmerge = index.packages[number].get('usrmerge', False)
+
+    def package(self, key):
+        return self.indexes[key[0]].packages[key[1]]
+
+    def package_string(self, key):
+        package = self.package(key)
+        return ' '.join((package['name'], package['version'], package['release'], package['arch']))
+
+    def entries(self, path):
+        entries = []
+        for number, (index, considered) in enumerate(zip(self.indexes, self.considered)):
+            for variant in path_variants(path, self.usrmerge):
+                entries.extend(((number, package), mode) for package, mode in index.lookup(variant)
+                               if package in considered)
+        if entries and all(mode_type(mode) != 0o40000 for _, mode in entries):
+            # files clashing with directories of other packages
+            owners = set()
+            for number, (index, considered) in enumerate(zip(self.indexes, self.considered)):
+                for variant in path_variants(path, self.usrmerge):
+                    owners.update((number, package) for package in index.owners_below(variant)
+                                  if package in considered)
+            entries.extend((owner, DIR_MODE) for owner in owners)
+        return entries
+
+    def ignored_pair(self, key1, key2):
+        package1 = self.package(key1)
+        package2 = self.package(key2)
+        for p1, p2 in ((package1, package2), (package2, package1)):
+            provides = set(p2['provides'])
+            if any(conflict in provides for conflict in p1['conflicts']):
+                return True
+            if p2['name'] in provides and p2['name'] in p1['obsoletes'] + [p1['name']]:
+                return True
+            # let 32bit packages conflict with the i586 version
+            if p1['name'] == p2['name'] + '-32bit' and p2['arch'] in ('i586', 'i686') and p2['name'] in provides:
+                return True
+        return False
+
+    def probe_paths(self, targets):
+        paths = set()
+        for key in targets:
+            for path, _ in self.indexes[key[0]].files(key[1]):
+                if self.usrmerge:
+                    path = usrmerged(path)
+                paths.add(path)
+                parent = path
+                while parent.count('/') > 1:
+                    parent = parent[:parent.rindex('/')]
+                    paths.add(parent)
+        return paths
+
+    def conflicts(self, target_packages=None):
+        """
+        Return the conflicts involving the target packages, by default all
+        packages of the first index, in the structure of the findfileconflicts
+        output.
+        """
+        targets = set((0, number) for number in self.considered[0]
+                      if target_packages is None or self.indexes[0].packages[number]['name'] in target_packages)
+
+        found = {}
+        ignored = {}
+        for path in sorted(self.probe_paths(targets)):
+            if re.search(r'/etc/uefi/certs/.*crt', path):
+                continue
+            entries = sorted(self.entries(path), key=lambda entry: (self.package_string(entry[0]), entry[1]))
+            keys = [key for key, _ in entries]
+            if len(set(keys)) < 2 or not targets.intersection(keys):
+                continue
+
+            # trivial multiarch conflicts and directories of the same mode
+            strings = [self.package_string(key) for key in keys]
+            if len(set(string.split(' ', 1)[0] for string in strings)) == 1 and len(set(strings)) == len(strings):
+                continue
+            modes = set(mode for _, mode in entries)
+            if len(modes) == 1 and mode_type(next(iter(modes))) == 0o40000:
+                continue
+
+            unique = sorted(set(keys), key=self.package_string)
+            for i, key1 in enumerate(unique):
+                for key2 in unique[i + 1:]:
+                    if key1 not in targets and key2 not in targets:
+                        continue
+                    pair = (key1, key2)
+                    if pair not in ignored:
+                        ignored[pair] = self.ignored_pair(key1, key2)
+                    if ignored[pair]:
+                        continue
+
+                    pp = [mode for key, mode in entries if key in pair]
+                    info = ''
+                    if len(set(pp)) == 1:
+                        if mode_type(pp[0]) in (0o40000, 0o120000) or mode_ghost(pp[0]):
+                            continue
+                    elif any(mode_type(mode) not in (0o100000, 0o120000) or mode_ghost(mode) for mode in pp):
+                        info = ' [mode mismatch: {}]'.format(', '.join(beautify_mode(mode) for mode in pp))
+                    found.setdefault(pair, []).append(path + info)
+
+        conflicts = []
+        for (key1, key2), paths in sorted(found.items(), key=lambda item: [self.package_string(k) for k in item[0]]):
+            conflicts.append({
+                'between': [self.package_string(key1).split(' '), self.package_string(key2).split(' ')],
+                'conflicts': '\n'.join(paths),
+            })
+        return conflicts
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from lxml import etree as ET
+from osc.core import makeurl
+
+from osclib.cache_manager import CacheManager
+from osclib.core import http_GET, repository_arch_state
+
+# Bulk access to the fileinfo_ext view of the binaries of a repository.
+#
+# Results are cached in memory and on disk per repository state, so they stay
+# valid until something in the repository is rebuilt. Lookups of many
+# binaries are fetched with bounded concurrency instead of one GET after the
+# other.
+
+
+class FileInfoService(object):
+    JOBS = 8
+
+    def __init__(self, apiurl, project, repository, arch, jobs=JOBS):
+        self.apiurl = apiurl
+        self.project = project
+        self.repository = repository
+        self.arch = arch
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        self._state = None
+        self.binaries = {}
+        self.fileinfos = {}
+        self.requires_index = {}
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = repository_arch_state(self.apiurl, self.project, self.repository, self.arch) or 'none'
+        return self._state
+
+    def cache_path(self, package, filename):
+        directory = CacheManager.directory('fileinfo_ext', urlparse(self.apiurl).hostname,
+                                           self.project, self.repository, self.arch, self.state, package)
+        return os.path.join(directory, filename + '.xml')
+
+    def fileinfo(self, package, filename):
+        """fileinfo_ext of a binary of a package, use '_repository' to look it up by name."""
+        key = (package, filename)
+        with self.lock:
+            if key in self.fileinfos:
+                return self.fileinfos[key]
+
+        path = self.cache_path(package, filename)
+        if os.path.exists(path):
+            fileinfo = ET.parse(path).getroot()
+        else:
+            url = makeurl(self.apiurl, ['build', self.project, self.repository, self.arch, package, filename],
+                          {'view': 'fileinfo_ext'})
+            content = http_GET(url).read()
+            fileinfo = ET.fromstring(content)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                f.write(content)
+            os.rename(f.name, path)
+
+        with self.lock:
+            self.fileinfos[key] = fileinfo
+        return fileinfo
+
+    def package_binaries(self, package):
+        """Filenames of the binary rpms of a package as fileinfo_ext_all() considers them."""
+        with self.lock:
+            if package in self.binaries:
+                return self.binaries[package]
+
+        url = makeurl(self.apiurl, ['build', self.project, self.repository, self.arch, package])
+        binaries = []
+        for binary in ET.parse(http_GET(url)).getroot().findall('binary'):
+            filename = binary.get('filename')
+            if not filename.endswith('.rpm'):
+                continue
+            if filename.endswith('.src.rpm'):
+                continue
+            if '-debuginfo-' in filename or '-debugsource-' in filename:
+                continue
+            binaries.append(filename)
+
+        with self.lock:
+            self.binaries[package] = binaries
+        return binaries
+
+    def _map(self, function, items):
+        items = list(items)
+        if len(items) < 2 or self.jobs < 2:
+            return [function(*item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(lambda item: function(*item), items))
+
+    def packages(self, packages):
+        """Return the fileinfo_ext of all binaries of the packages, fetched in bulk."""
+        packages = list(packages)
+        binaries = self._map(self.package_binaries, [(package,) for package in packages])
+        items = [(package, filename) for package, filenames in zip(packages, binaries) for filename in filenames]
+        fileinfos = self._map(self.fileinfo, items)
+
+        result = {package: [] for package in packages}
+        for (package, _), fileinfo in zip(items, fileinfos):
+            result[package].append(fileinfo)
+        return result
+
+    def requires(self, name):
+        """
+        Reverse provides index of a binary from the repository.
+
+        Returns the requires_ext elements by the name of their dependency
+        (without version) and the list of all requires_ext elements.
+        """
+        with self.lock:
+            if name in self.requires_index:
+                return self.requires_index[name]
+
+        by_dep = {}
+        requires = self.fileinfo('_repository', name + '.rpm').findall('requires_ext')
+        for require in requires:
+            by_dep.setdefault(require.get('dep').split(' ')[0], []).append(require)
+
+        with self.lock:
+            self.requires_index[name] = (by_dep, requires)
+        return by_dep, requires
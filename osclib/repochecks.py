@@ -1,22 +1,33 @@
+import hashlib
+import json
 import logging
 import os
 import re
 import requests
 import subprocess
 import tempfile
+import threading
+import time
 import glob
 from fnmatch import fnmatch
 from lxml import etree as ET
 from osc.core import http_GET
+from urllib.parse import urlparse
 
-import yaml
+import solv
 
 from osclib.cache_manager import CacheManager
+from osclib.fileconflicts import CorruptRepository, FileConflicts, file_index
+from osclib.util import sha1_short
 
 logger = logging.getLogger('InstallChecker')
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 CACHEDIR = CacheManager.directory('repository-meta')
+# content addressed store of the mirrored rpm headers, hardlinked into the
+# mirrors in CACHEDIR so headers shared by projects are stored only once
+BLOBDIR = CacheManager.directory('repository-blobs')
+BLOB_GC_FREQUENCY = 60 * 60 * 24
 
 
 class CorruptRepos(Exception):
@@ -61,29 +72,25 @@ def _check_conflicts_whitelist(sp1, sp2, whitelist):
         return True
 
 
-def _fileconflicts(pfile, target_packages, whitelist):
-    script = os.path.join(SCRIPT_PATH, '..', 'findfileconflicts')
-    p = subprocess.run(['perl', script, pfile], stdout=subprocess.PIPE)
-    if p.returncode or len(p.stdout):
-        output = ''
-        conflicts = yaml.safe_load(p.stdout)
-        for conflict in conflicts:
-            sp1 = conflict['between'][0]
-            sp2 = conflict['between'][1]
+def _fileconflicts(indexes, target_packages, whitelist):
+    output = ''
+    for conflict in FileConflicts(indexes).conflicts(target_packages):
+        sp1 = conflict['between'][0]
+        sp2 = conflict['between'][1]
 
-            if not sp1[0] in target_packages and not sp2[0] in target_packages:
-                continue
+        if not sp1[0] in target_packages and not sp2[0] in target_packages:
+            continue
 
-            if _check_conflicts_whitelist(sp1, sp2, whitelist):
-                continue
+        if _check_conflicts_whitelist(sp1, sp2, whitelist):
+            continue
 
-            output += "found conflict of {} with {}\n".format(_format_pkg(sp1), _format_pkg(sp2))
-            for file in conflict['conflicts'].split('\n'):
-                output += "  {}\n".format(file)
-            output += "\n"
+        output += "found conflict of {} with {}\n".format(_format_pkg(sp1), _format_pkg(sp2))
+        for file in conflict['conflicts'].split('\n'):
+            output += "  {}\n".format(file)
+        output += "\n"
 
-        if len(output):
-            return output
+    if len(output):
+        return output
 
 
 def filter_release(line):
@@ -93,84 +100,354 @@ def filter_release(line):
     return line
 
 
-def parsed_installcheck(repos, arch, target_packages, whitelist):
-    reported_problems = dict()
+def maparch2installarch(arch):
+    _mapping = {'armv6l': 'armv6hl',
+                'armv7l': 'armv7hl'}
+    if arch in _mapping:
+        return _mapping[arch]
+    return arch
+
+
+def _solvable_source(s):
+    # don't ask me why, but that's how it seems to work
+    if s.lookup_void(solv.SOLVABLE_SOURCENAME):
+        return s.name
+    return s.lookup_str(solv.SOLVABLE_SOURCENAME)
+
+
+class InstallcheckEngine(object):
+    """
+    In-process replacement for /usr/bin/installcheck.
+
+    Repositories are either mirrored directories of rpms or primary.xml files
+    as returned by mirror(). They are loaded once per architecture into a
+    solv.Pool and reused by later checks, e.g. for all stagings of a run
+    sharing the same target repositories. Directories are additionally cached
+    as solv file within the directory itself.
+
+    At most max_repos repositories are kept per architecture, the least
+    recently used ones not needed by the current check are dropped.
+
+    The pools are shared, so checks from several threads are serialized.
+    """
+
+    def __init__(self, max_repos=8):
+        # arch -> (pool, {path: (key, repo)}) in order of use
+        self.pools = {}
+        self.max_repos = max_repos
+        # arch -> considered solvables whatprovides was created for
+        self.provided = {}
+        self.lock = threading.Lock()
+
+    def pool(self, arch):
+        if arch not in self.pools:
+            pool = solv.Pool()
+            pool.setarch(maparch2installarch(arch))
+            self.pools[arch] = (pool, {})
+        return self.pools[arch]
+
+    @staticmethod
+    def repo_key(path):
+        if not os.path.isdir(path):
+            st = os.stat(path)
+            return '{}-{}-{}'.format(os.path.basename(path), st.st_size, st.st_mtime)
+
+        # mtime is not usable as the rpms are touched to avoid pruning
+        key = hashlib.sha1()
+        for rpm in sorted(glob.glob(glob.escape(path) + '/*.rpm')):
+            key.update('{} {}\n'.format(os.path.basename(rpm), os.path.getsize(rpm)).encode('utf-8'))
+        return key.hexdigest()
+
+    def repo_load_directory(self, repo, path, key):
+        cachedir = os.path.join(path, '.cache')
+        cachefile = os.path.join(cachedir, 'installcheck-{}.solv'.format(key))
+        if os.path.exists(cachefile) and repo.add_solv(cachefile):
+            return
+
+        flags = solv.Repo.REPO_REUSE_REPODATA | solv.Repo.REPO_NO_INTERNALIZE
+        for rpm in sorted(glob.glob(glob.escape(path) + '/*.rpm')):
+            if not repo.add_rpm(rpm, flags):
+                logger.error('failed to read {}'.format(rpm))
+                raise CorruptRepos
+        repo.internalize()
+
+        os.makedirs(cachedir, exist_ok=True)
+        for oldfile in glob.glob(glob.escape(cachedir) + '/installcheck-*.solv'):
+            if oldfile == cachefile:
+                continue
+            try:
+                os.unlink(oldfile)
+            except FileNotFoundError:
+                # removed by a concurrent worker process
+                pass
+        with tempfile.NamedTemporaryFile(dir=cachedir, delete=False) as cachetemp:
+            ofh = solv.xfopen_fd(None, cachetemp.fileno())
+            repo.write(ofh)
+            ofh.close()
+        os.rename(cachetemp.name, cachefile)
+
+    def repo(self, arch, path):
+        pool, repos = self.pool(arch)
+        key = self.repo_key(path)
+        if path in repos:
+            key_loaded, repo = repos.pop(path)
+            if key_loaded == key:
+                repos[path] = (key_loaded, repo)
+                return repo, False
+            repo.free(True)
+
+        repo = pool.add_repo(path)
+        if os.path.isdir(path):
+            self.repo_load_directory(repo, path, key)
+        else:
+            repo.add_rpmmd(solv.xfopen(path), None, 0)
+        repos[path] = (key, repo)
+        return repo, True
+
+    def repos_prune(self, arch, paths):
+        """Drop the least recently used repositories not in paths, return if any were dropped."""
+        _, repos = self.pool(arch)
+        unused = [path for path in repos if path not in paths]
+        unused = unused[:max(len(repos) - self.max_repos, 0)]
+        for path in unused:
+            repos.pop(path)[1].free(True)
+        return len(unused) > 0
+
+    @staticmethod
+    def solvable_identity(s):
+        return '{}@{}'.format(s.str(), s.lookup_num(solv.SOLVABLE_BUILDTIME))
+
+    @staticmethod
+    def state_load(state_file):
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                try:
+                    return json.load(f)
+                except ValueError:
+                    pass
+        return {'binaries': {}, 'checked': [], 'problems': {}}
+
+    @staticmethod
+    def state_save(state_file, state):
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(state_file), delete=False) as f:
+            json.dump(state, f)
+        os.rename(f.name, state_file)
+
+    def dependency_index(self, pool, solvables):
+        """
+        Fingerprint every solvable and index the reverse dependencies.
+
+        The fingerprint covers the solvable and the providers of each of its
+        requirements, so it also changes whenever a provider appears or
+        disappears, which the reverse dependencies of the current pool can not
+        tell for removed binaries.
+        """
+        identities = {s.id: self.solvable_identity(s) for s in solvables}
+        fingerprints = {}
+        required_by = {}
+        for s in solvables:
+            fingerprint = hashlib.sha1(identities[s.id].encode('utf-8'))
+            for dep in s.lookup_deparray(solv.SOLVABLE_REQUIRES, 0):
+                providers = [p.id for p in pool.whatprovides(dep) if p.id in identities]
+                fingerprint.update('\n{}:{}'.format(dep, ' '.join(sorted(identities[p] for p in providers))).encode('utf-8'))
+                for p in providers:
+                    if p != s.id:
+                        required_by.setdefault(p, set()).add(s.id)
+            fingerprints[identities[s.id]] = fingerprint.hexdigest()
+        return identities, fingerprints, required_by
+
+    def affected(self, identities, fingerprints, required_by, previous):
+        """Return the ids of changed solvables and their reverse dependency closure."""
+        queue = [sid for sid, identity in identities.items()
+                 if previous.get(identity) != fingerprints[identity]]
+        affected = set(queue)
+        while queue:
+            for sid in required_by.get(queue.pop(), ()):
+                if sid not in affected:
+                    affected.add(sid)
+                    queue.append(sid)
+        return affected
+
+    def problems(self, pool, solver, s, considered):
+        problems = solver.solve([pool.Job(solv.Job.SOLVER_INSTALL | solv.Job.SOLVER_SOLVABLE, s.id)])
+        if not problems:
+            return None
+
+        output = []
+        for problem in problems:
+            for rule in problem.findallproblemrules():
+                for info in rule.allinfos():
+                    # shadowed packages are not installable by design
+                    if info.type == solv.Solver.SOLVER_RULE_PKG_NOT_INSTALLABLE and \
+                       info.solvable.id not in considered:
+                        continue
+                    output.append(filter_release(info.problemstr()))
+        return {'problem': s.str(), 'output': output}
+
+    def check(self, paths, arch, target_packages=None, whitelist=(), state_file=None):
+        """
+        Check installability of the packages in the first repository.
+
+        Packages of a name are only taken from the first repository providing
+        that name. target_packages maps the names to check to their source
+        package, by default all packages of the first repository are checked.
+
+        With a state_file only the packages affected by binaries changed since
+        the last check with that state are checked again, the results of the
+        other packages are taken from the state.
+
+        Returns the same structure as parsed_installcheck().
+        """
+        with self.lock:
+            return self._check(paths, arch, target_packages, whitelist, state_file)
+
+    def _check(self, paths, arch, target_packages, whitelist, state_file):
+        pool, _ = self.pool(arch)
+        repos = []
+        changed = False
+        for path in paths:
+            repo, loaded = self.repo(arch, path)
+            repos.append(repo)
+            changed = changed or loaded
+        changed = self.repos_prune(arch, paths) or changed
+        if changed:
+            pool.addfileprovides()
+
+        solvables = []
+        names = set()
+        targets = []
+        for repo in repos:
+            repo_names = set()
+            for s in repo.solvables_iter():
+                if s.arch in ('src', 'nosrc') or s.name in names:
+                    continue
+                repo_names.add(s.name)
+                solvables.append(s)
+                if repo == repos[0] and (target_packages is None or s.name in target_packages):
+                    targets.append(s)
+            names |= repo_names
+        considered = frozenset(s.id for s in solvables)
+        pool.set_considered_list(list(considered))
+        if changed or self.provided.get(arch) != considered:
+            # whatprovides only lists the considered solvables, so a shadowed
+            # package does not provide anything, like it was not part of the
+            # merged repository the installcheck tool was run on
+            pool.createwhatprovides()
+            self.provided[arch] = considered
+
+        targets = [s for s in targets if s.installable()]
+        to_check = targets
+        if state_file:
+            state = self.state_load(state_file)
+            identities, fingerprints, required_by = self.dependency_index(pool, solvables)
+            affected = self.affected(identities, fingerprints, required_by, state['binaries'])
+            checked = set(state['checked'])
+            to_check = [s for s in targets if s.id in affected or identities[s.id] not in checked]
+            logger.info('incremental installcheck: {} of {} packages affected'.format(len(to_check), len(targets)))
+
+        problems = dict()
+        if len(to_check):
+            # like installcheck, try to install everything at once first and
+            # only check the packages individually that did not make it
+            solver = pool.Solver()
+            solver.set_flag(solv.Solver.SOLVER_FLAG_IGNORE_RECOMMENDED, 1)
+            jobs = [pool.Job(solv.Job.SOLVER_INSTALL | solv.Job.SOLVER_SOLVABLE | solv.Job.SOLVER_WEAK, s.id)
+                    for s in to_check]
+            solver.solve(jobs)
+            installed = set(s.id for s in solver.transaction().newsolvables())
+
+            for s in to_check:
+                if s.id in installed:
+                    continue
+                problem = self.problems(pool, solver, s, considered)
+                if problem:
+                    problems[s.id] = problem
+
+        if state_file:
+            checked = set(s.id for s in to_check)
+            for s in targets:
+                if s.id not in checked and identities[s.id] in state['problems']:
+                    problems[s.id] = state['problems'][identities[s.id]]
+            self.state_save(state_file, {
+                'binaries': fingerprints,
+                'checked': [identities[s.id] for s in targets],
+                'problems': {identities[sid]: problem for sid, problem in problems.items()},
+            })
+
+        reported_problems = dict()
+        for s in targets:
+            if s.id not in problems:
+                continue
+            if s.name in whitelist:
+                logger.debug("{} fails installcheck but is white listed".format(s.name))
+                continue
+
+            if target_packages is None:
+                source = _solvable_source(s)
+            else:
+                source = target_packages[s.name]
+            reported_problems[s.name] = dict(problems[s.id], source=source)
 
-    if not len(target_packages):
         return reported_problems
 
-    def maparch2installarch(arch):
-        _mapping = {'armv6l': 'armv6hl',
-                    'armv7l': 'armv7hl'}
-        if arch in _mapping:
-            return _mapping[arch]
-        return arch
 
-    if not isinstance(repos, list):
-        repos = [repos]
+ENGINE = InstallcheckEngine()
 
-    p = subprocess.run(['/usr/bin/installcheck', maparch2installarch(arch)] + repos,
-                       stdout=subprocess.PIPE, errors='backslashreplace', text=True)
-    if p.returncode:
-        in_problem = False
-        package = None
-        install_re = re.compile(r"^can't install (.*)(-[^-]+-[^-]+):$")
-        for line in p.stdout.split('\n'):
-            if not line.startswith(' '):
-                in_problem = False
-            match = install_re.match(line)
-            if match:
-                package = match.group(1)
-                in_problem = False
-                if package not in target_packages:
-                    continue
-                if package in whitelist:
-                    logger.debug("{} fails installcheck but is white listed".format(package))
-                    continue
-                reported_problems[package] = {'problem': match.group(
-                    1) + match.group(2), 'output': [], 'source': target_packages[package]}
-                in_problem = True
-                continue
-            if in_problem:
-                reported_problems[package]['output'].append(filter_release(line[2:]))
 
-    return reported_problems
+def installcheck_state_file(apiurl, project, repository, arch, repos):
+    """
+    Path of the state for incremental installchecks of a repository checked
+    against repos, the mirrored repositories of its path.
+    """
+    directory = CacheManager.directory('installcheck-state', urlparse(apiurl).hostname, project, repository)
+    return os.path.join(directory, '{}-{}.json'.format(arch, sha1_short(list(repos))))
+
 
+def parsed_installcheck(repos, arch, target_packages, whitelist, engine=ENGINE, state_file=None):
+    """
+    Check installability of target_packages within the first repository.
 
-def installcheck(directories, arch, whitelist, ignore_conflicts):
+    repos are mirrored directories or primary.xml files as returned by
+    mirror(). Returns a dict of the failing packages with the problem, the
+    problem description lines and the source package. With a state_file only
+    packages affected by changed binaries are checked, see
+    installcheck_state_file().
+    """
+    if target_packages is not None and not len(target_packages):
+        return dict()
 
-    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
-        pfile = os.path.join(dir, 'packages')
+    if not isinstance(repos, list):
+        repos = [repos]
 
-        script = os.path.join(SCRIPT_PATH, '..', 'write_repo_susetags_file.pl')
-        parts = ['perl', script, dir] + directories
+    return engine.check(repos, arch, target_packages, whitelist, state_file)
 
-        p = subprocess.run(parts)
-        if p.returncode:
-            # technically only 126, but there is no other value atm -
-            # so if some other perl error happens, we don't continue
-            raise CorruptRepos
 
-        target_packages = []
-        with open(os.path.join(dir, 'catalog.yml')) as file:
-            catalog = yaml.safe_load(file)
-            target_packages = catalog.get(directories[0], [])
+def installcheck(directories, arch, whitelist, ignore_conflicts, state_file=None):
+    try:
+        indexes = [file_index(directory) for directory in directories if os.path.isdir(directory)]
+    except CorruptRepository as e:
+        # the rpm headers could not be read or the file index is invalid
+        logger.error(str(e))
+        raise CorruptRepos
 
-        parts = []
-        output = _fileconflicts(pfile, target_packages, ignore_conflicts)
+    parts = []
+    target_packages = {}
+    if os.path.isdir(directories[0]):
+        target_packages = indexes[0].catalog()
+        output = _fileconflicts(indexes, target_packages, ignore_conflicts)
         if output:
             parts.append(output)
 
-        parsed = parsed_installcheck(pfile, arch, target_packages, whitelist)
-        if len(parsed):
-            output = ''
-            for package in sorted(parsed):
-                output += "can't install " + parsed[package]['problem'] + ":\n"
-                output += "\n".join(parsed[package]['output'])
-                output += "\n\n"
-            parts.append(output)
+    parsed = parsed_installcheck(directories, arch, target_packages, whitelist, state_file=state_file)
+    if len(parsed):
+        output = ''
+        for package in sorted(parsed):
+            output += "can't install " + parsed[package]['problem'] + ":\n"
+            output += "\n".join(parsed[package]['output'])
+            output += "\n\n"
+        parts.append(output)
 
-        return parts
+    return parts
 
 
 def mirrorRepomd(cachedir, url):
@@ -219,9 +496,40 @@ def mirror(apiurl, project, repository, arch):
     path = '/'.join((project, repository, arch))
     logger.info('mirroring {}'.format(path))
     url = '{}/public/build/{}'.format(apiurl, path)
-    p = subprocess.run(['perl', script, '--nodebug', url, directory])
+    p = subprocess.run(['perl', script, '--nodebug', '--blobs', BLOBDIR, url, directory])
 
     if p.returncode:
         raise Exception('failed to mirror {}'.format(path))
 
+    mirror_gc()
+
     return directory
+
+
+def mirror_gc(force=False):
+    """
+    Remove the blobs no mirror links to anymore, at most once per
+    BLOB_GC_FREQUENCY unless forced.
+    """
+    stamp = os.path.join(BLOBDIR, '.gc')
+    if not force and os.path.exists(stamp) and time.time() - os.stat(stamp).st_mtime < BLOB_GC_FREQUENCY:
+        return
+    with open(stamp, 'a'):
+        os.utime(stamp, None)
+
+    removed = 0
+    removed_bytes = 0
+    for entry in os.scandir(BLOBDIR):
+        if not entry.is_dir():
+            continue
+        for blob in os.scandir(entry.path):
+            stat = blob.stat()
+            if stat.st_nlink > 1:
+                continue
+            # bs_mirrorfull falls back to downloading if a blob vanishes
+            # while it links it
+            os.unlink(blob.path)
+            removed += 1
+            removed_bytes += stat.st_size
+
+    logger.info('removed {} unused blobs comprised of {:,} bytes'.format(removed, removed_bytes))
@@ -13,6 +13,8 @@ def _is_int(x):
 
 
 class RequestFinder(object):
+    # number of arguments looked up by a single search
+    BATCH_SIZE = 100
 
     def __init__(self, api):
         """
@@ -132,6 +134,55 @@ class RequestFinder(object):
 
         return ret
 
+    def find_batch(self, pkgs):
+        """
+        Look up request ids and packages with open requests using one search
+        per BATCH_SIZE arguments
+        :param pkgs: request ids and package names
+        :return dict of the found arguments with dicts of SR#s and their details
+        """
+        found = {}
+        pkgs = [str(p) for p in pkgs]
+        for i in range(0, len(pkgs), self.BATCH_SIZE):
+            batch = pkgs[i:i + self.BATCH_SIZE]
+            ids = [p for p in batch if _is_int(p)]
+            packages = [p for p in batch if not _is_int(p)]
+
+            # same conditions as find_request_id() and find_request_package()
+            clauses = ["@id='{}'".format(request_id) for request_id in ids]
+            if packages:
+                clauses.append("(action/target/@project='{}' and ({}) and "
+                               "(state/@name='new' or state/@name='review') and "
+                               "(action/@type='submit' or action/@type='delete'))".format(
+                                   self.api.project,
+                                   ' or '.join("action/target/@package='{}'".format(p) for p in packages)))
+            url = self.api.makeurl(['search', 'request'], {'match': ' or '.join(clauses)})
+            root = ET.parse(http_GET(url)).getroot()
+
+            for sr in root.findall('request'):
+                request = sr.get('id')
+                target = sr.find('action').find('target')
+                project = target.get('project')
+                if request in ids:
+                    if (project != self.api.project and not project.startswith(self.api.cstaging)):
+                        msg = 'Request {} is not for {}, but for {}'
+                        msg = msg.format(request, self.api.project, project)
+                        raise oscerr.WrongArgs(msg)
+                    found[request] = {int(request): {'project': project}}
+
+                package = target.get('package')
+                if package in packages and project == self.api.project:
+                    state = sr.find('state').get('name')
+                    found.setdefault(package, {})[int(request)] = {'project': project, 'state': state}
+
+            for package in packages:
+                if len(found.get(package, {})) > 1:
+                    msg = 'There are multiple requests for package "{}": {}'
+                    msg = msg.format(package, ', '.join(str(r) for r in sorted(found[package])))
+                    raise oscerr.WrongArgs(msg)
+
+        return found
+
     def find(self, pkgs, newcand, consider_stagings):
         """
         Search for all various mutations and return list of SR#s
@@ -140,10 +191,13 @@ class RequestFinder(object):
 
         This function is only called for its side effect.
         """
+        found = self.find_batch(pkgs)
         for p in pkgs:
-            if _is_int(p) and self.find_request_id(p):
+            if str(p) in found:
+                self.srs.update(found[str(p)])
                 continue
-            if self.find_request_package(p):
+            # requests in other states
+            if _is_int(p) and self.find_request_id(p):
                 continue
             if self.find_request_project(p, newcand):
                 continue
@@ -161,8 +215,7 @@ class RequestFinder(object):
         This function is only called for its side effect.
         """
 
-        url = self.api.makeurl(['staging', self.api.project, 'staging_projects'], {'requests': 1})
-        status = ET.parse(self.api.retried_GET(url)).getroot()
+        status = self.api.snapshot().root
 
         for p in pkgs:
             found = False
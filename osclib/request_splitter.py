@@ -3,12 +3,23 @@ import dateutil.parser
 from lxml import etree as ET
 from osc import conf
 from osc.core import show_project_meta
-from osclib.core import devel_project_fallback
+from osclib.core import devel_project_get
+from osclib.core import devel_project_index
 from osclib.core import request_age
 from osclib.util import sha1_short
 import re
 
 
+# compiled filter and group expressions, strategies add the same ones on every split()
+XPATHS = {}
+
+
+def xpath_compile(xpath):
+    if xpath not in XPATHS:
+        XPATHS[xpath] = ET.XPath(xpath)
+    return XPATHS[xpath]
+
+
 class RequestSplitter(object):
     def __init__(self, api, requests, in_ring, stageable=True):
         self.api = api
@@ -60,7 +71,7 @@ class RequestSplitter(object):
             self.strategy_set(strategy['name'])
 
     def filter_add(self, xpath):
-        self.filters.append(ET.XPath(xpath))
+        self.filters.append(xpath_compile(xpath))
 
     def filter_add_requests(self, requests):
         requests = ' ' + ' '.join(requests) + ' '
@@ -69,7 +80,7 @@ class RequestSplitter(object):
                         .format(requests=requests))
 
     def group_by(self, xpath, required=False):
-        self.groups.append(ET.XPath(xpath))
+        self.groups.append(xpath_compile(xpath))
         if required:
             self.filter_add(xpath)
 
@@ -122,7 +133,7 @@ class RequestSplitter(object):
         target = request.find('./action/target')
         target_project = target.get('project')
         target_package = target.get('package')
-        devel, _ = devel_project_fallback(self.api.apiurl, target_project, target_package)
+        devel = self.devel_project(target_project, target_package)
         if not devel and request_type == 'submit':
             devel = request.find('./action/source').get('project')
         if devel:
@@ -141,6 +152,20 @@ class RequestSplitter(object):
 
         request.set('postponed', 'False')
 
+    def devel_project(self, target_project, target_package):
+        """Same as devel_project_fallback() but looks up all packages of a project at once."""
+        project, _ = devel_project_index(self.api.apiurl, target_project).get(target_package, (None, None))
+        if project is None and target_project != 'openSUSE:Factory':
+            if target_project.startswith('openSUSE:'):
+                project, _ = devel_project_index(self.api.apiurl, 'openSUSE:Factory').get(target_package, (None, None))
+            elif target_project.startswith('SUSE:'):
+                # Remote projects can not be searched so look up the package.
+                project, _ = devel_project_get(self.api.apiurl, 'openSUSE.org:openSUSE:Factory', target_package)
+                if project:
+                    project = project.split(':', 1)[1]
+
+        return project
+
     def ring_get(self, target_package):
         if self.api.conlyadi:
             return None
@@ -219,28 +244,30 @@ class RequestSplitter(object):
             # attempt to use even if the normal conditions are not met.
             should_always = True
 
-        for staging in stagings:
-            project = self.api.prj_from_short(staging)
-            status = self.api.project_status(project)
-            bootstrapped = self.api.is_staging_bootstrapped(project)
-
-            # Store information about staging.
-            self.stagings[staging] = {
-                'project': project,
-                'bootstrapped': bootstrapped,
-                # TODO: find better place for splitter info
-                'splitter_info': {'strategy': {'name': 'none'}},
-                'status': status
-            }
-
-            # Decide if staging of interested.
-            if self.is_staging_mergeable(staging) and (should_always or self.should_staging_merge(staging)):
-                if self.stagings[staging]['splitter_info']['strategy']['name'] == 'none':
-                    self.stagings_mergeable_none.append(staging)
-                else:
-                    self.stagings_mergeable.append(staging)
-            elif self.is_staging_considerable(staging):
-                self.stagings_considerable.append(staging)
+        # status of all stagings in one call
+        with self.api.staging_snapshot(status=True):
+            for staging in stagings:
+                project = self.api.prj_from_short(staging)
+                status = self.api.project_status(project)
+                bootstrapped = self.api.is_staging_bootstrapped(project)
+
+                # Store information about staging.
+                self.stagings[staging] = {
+                    'project': project,
+                    'bootstrapped': bootstrapped,
+                    # TODO: find better place for splitter info
+                    'splitter_info': {'strategy': {'name': 'none'}},
+                    'status': status
+                }
+
+                # Decide if staging of interested.
+                if self.is_staging_mergeable(staging) and (should_always or self.should_staging_merge(staging)):
+                    if self.stagings[staging]['splitter_info']['strategy']['name'] == 'none':
+                        self.stagings_mergeable_none.append(staging)
+                    else:
+                        self.stagings_mergeable.append(staging)
+                elif self.is_staging_considerable(staging):
+                    self.stagings_considerable.append(staging)
 
         # Allow both considered and remaining to be accessible after proposal.
         self.stagings_available = list(self.stagings_considerable)
@@ -0,0 +1,83 @@
+import json
+import logging
+import time
+
+from osclib.PubSubConsumer import PubSubConsumer
+
+
+class ReviewListener(PubSubConsumer):
+    """
+    Check requests as soon as the message bus announces a change to them.
+
+    Request ids of incoming events are collected and handed to the check
+    callback in batches. The sweep callback performs a full search and is run
+    on startup, after reconnecting and every sweep_interval seconds as safety
+    net for missed events.
+    """
+
+    EVENTS = ('create', 'change', 'state_change', 'review_wanted', 'review_changed', 'reviews_done')
+    # seconds to wait for further events before checking the collected requests
+    BATCH_DELAY = 5
+
+    def __init__(self, amqp_prefix, check, sweep, sweep_interval, logger=None):
+        super(ReviewListener, self).__init__(amqp_prefix, logger or logging.getLogger(__name__))
+        self.amqp_prefix = amqp_prefix
+        self.check = check
+        self.sweep = sweep
+        self.sweep_interval = sweep_interval
+        self.pending = set()
+        self.last_sweep = 0
+
+    def routing_keys(self):
+        return ['{}.obs.request.{}'.format(self.amqp_prefix, event) for event in self.EVENTS]
+
+    def interval(self):
+        if len(self.pending):
+            return self.BATCH_DELAY
+        until_sweep = self.last_sweep + self.sweep_interval - time.time()
+        return max(self.BATCH_DELAY, min(until_sweep, super(ReviewListener, self).interval()))
+
+    def start_consuming(self):
+        # events may have been missed while (re-)connecting
+        self.last_sweep = 0
+        super(ReviewListener, self).start_consuming()
+
+    def run_callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            self.logger.exception(e)
+
+    def still_alive(self):
+        if time.time() - self.last_sweep >= self.sweep_interval:
+            self.logger.info('running full sweep')
+            # the sweep covers everything that is pending
+            self.pending = set()
+            self.last_sweep = time.time()
+            self.run_callback(self.sweep)
+        elif len(self.pending):
+            ids = sorted(self.pending, key=int)
+            self.pending = set()
+            self.logger.info('checking requests changed on the bus: {}'.format(', '.join(ids)))
+            self.run_callback(self.check, ids)
+
+        super(ReviewListener, self).still_alive()
+
+    def on_message(self, unused_channel, method, properties, body):
+        self.acknowledge_message(method.delivery_tag)
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return
+
+        number = body.get('number')
+        if number is None:
+            self.logger.warning('request event without number: {}'.format(method.routing_key))
+            return
+
+        self.logger.debug('{} for request {}'.format(method.routing_key, number))
+        first = not len(self.pending)
+        self.pending.add(str(number))
+        if first:
+            # pick up the first change of a batch quickly
+            self.restart_timer()
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from lxml import etree as ET
 
 from osc import oscerr
@@ -12,11 +14,12 @@ MOVE = 'move'
 
 
 class SelectCommand(object):
-
-    def __init__(self, api, target_project):
+    def __init__(self, api, target_project, jobs=1):
         self.api = api
         self.affected_projects = set()
         self.target_project = target_project
+        # requests selected concurrently
+        self.jobs = jobs
 
     def _package(self, request):
         """
@@ -44,8 +47,7 @@ class SelectCommand(object):
         package = self._package(request)
 
         candidates = []   # Store candidates to be supersede by 'request'
-        url = self.api.makeurl(['staging', self.api.project, 'staging_projects'], {'requests': 1})
-        status = ET.parse(self.api.retried_GET(url)).getroot()
+        status = self.api.snapshot().root
         for prj in status.findall('staging_project'):
             for req in prj.findall('./staged_requests/request'):
                 if int(req.get('id')) < int(request) and req.get('package') == package:
@@ -106,6 +108,26 @@ class SelectCommand(object):
         else:
             raise oscerr.WrongArgs('Arguments for select are not correct.')
 
+    def select_requests(self, requests, move, filter_from, remove_exclusion=False):
+        """
+        Select the requests using jobs threads and stop at the first failure
+        in the order of the requests.
+
+        Selects already running are finished after a failure and requests
+        superseding each other must not be selected together.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        futures = [executor.submit(self.select_request, request, move, filter_from, remove_exclusion)
+                   for request in requests]
+        try:
+            for future in futures:
+                if not future.result():
+                    return False
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        return True
+
     def perform(self, requests, move=False,
                 filter_from=None, no_freeze=False, remove_exclusion=False):
         """
@@ -116,29 +138,35 @@ class SelectCommand(object):
         :param filter_from: filter request list to only those from a specific staging
         """
 
-        if self.api.is_adi_project(self.target_project):
-            no_freeze = True
-
-        # If the project is not frozen enough yet freeze it
-        if not (no_freeze or self.api.prj_frozen_enough(self.target_project)):
-            print('Project needs to be frozen or there was no change for last %d days.' % MAX_FROZEN_AGE)
-            print('Please freeze the project or use an option to ignore the time from the last freee.')
-            return False
+        # serve the staged requests of all stagings from one call
+        with self.api.staging_snapshot():
+            if self.api.is_adi_project(self.target_project):
+                no_freeze = True
 
-        # picks new candidate requests only if it's not to move requests
-        # ie. the review state of staging-project must be new if newcand is True
-        newcand = not move
-
-        requests = RequestFinder.find_sr(requests, self.api, newcand, consider_stagings=move)
-        requests_count = len(requests)
-        for index, request in enumerate(requests, start=1):
-            print('({}/{}) '.format(index, requests_count), end='')
-            if not self.select_request(request, move, filter_from, remove_exclusion=remove_exclusion):
+            # If the project is not frozen enough yet freeze it
+            if not (no_freeze or self.api.prj_frozen_enough(self.target_project)):
+                print('Project needs to be frozen or there was no change for last %d days.' % MAX_FROZEN_AGE)
+                print('Please freeze the project or use an option to ignore the time from the last freee.')
                 return False
 
-        # Notify everybody about the changes
-        self.api.update_status_or_deactivate(self.target_project, 'select')
-        for fprj in self.affected_projects:
-            self.api.update_status_or_deactivate(fprj, 'select')
+            # picks new candidate requests only if it's not to move requests
+            # ie. the review state of staging-project must be new if newcand is True
+            newcand = not move
+
+            requests = RequestFinder.find_sr(requests, self.api, newcand, consider_stagings=move)
+            requests_count = len(requests)
+            if self.jobs > 1 and requests_count > 1:
+                if not self.select_requests(requests, move, filter_from, remove_exclusion):
+                    return False
+            else:
+                for index, request in enumerate(requests, start=1):
+                    print('({}/{}) '.format(index, requests_count), end='')
+                    if not self.select_request(request, move, filter_from, remove_exclusion=remove_exclusion):
+                        return False
+
+            # Notify everybody about the changes
+            self.api.update_status_or_deactivate(self.target_project, 'select')
+            for fprj in self.affected_projects:
+                self.api.update_status_or_deactivate(fprj, 'select')
 
-        return True
+            return True
@@ -0,0 +1,48 @@
+class StagingSnapshot(object):
+    """
+    Status of all staging projects of a project as returned by a single
+    /staging/<project>/staging_projects?requests=1 call, with status=1 if
+    with_status.
+
+    The staging_project elements are the same as returned for a single
+    staging so they can be used wherever StagingAPI.project_status() results
+    are expected.
+    """
+
+    def __init__(self, root, with_status=True):
+        self.root = root
+        self.with_status = with_status
+        self.stagings = {}
+        self.requests = {}
+        self.packages = {}
+
+        for staging in root.findall('staging_project'):
+            name = staging.get('name')
+            self.stagings[name] = staging
+            for request in staging.findall('staged_requests/request'):
+                self.requests[request.get('id')] = (name, request)
+                self.packages[request.get('package')] = (name, request)
+
+    def status(self, staging):
+        """Return the staging_project element of staging or None if unknown."""
+        return self.stagings.get(staging)
+
+    def staging_for_request(self, request_id):
+        staged = self.requests.get(str(request_id))
+        return staged[0] if staged else None
+
+    def staging_for_package(self, package):
+        staged = self.packages.get(package)
+        return staged[0] if staged else None
+
+    def request_for_package(self, staging, package):
+        staged = self.packages.get(package)
+        if staged and staged[0] == staging:
+            return int(staged[1].get('id'))
+        return None
+
+    def package_for_request(self, staging, request_id):
+        staged = self.requests.get(str(request_id))
+        if staged and staged[0] == staging:
+            return staged[1].get('package')
+        return None
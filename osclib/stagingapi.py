@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import StringIO
 from datetime import datetime
 from typing import List
@@ -46,6 +48,7 @@ from osclib.comments import CommentAPI
 from osclib.ignore_command import IgnoreCommand
 from osclib.memoize import memoize
 from osclib.freeze_command import MAX_FROZEN_AGE
+from osclib.staging_snapshot import StagingSnapshot
 
 
 class StagingAPI(object):
@@ -64,11 +67,14 @@ class StagingAPI(object):
         self._rings = None
         self._ring_packages = None
         self._ring_packages_for_links = None
+        self._ring_sourceinfos = None
         self._packages_staged = None
         self._package_metas = dict()
         self._supersede = False
         self._package_disabled = {}
         self._is_staging_manager = None
+        self._staging_snapshot = None
+        self._staging_snapshot_active = False
 
         Cache.init()
 
@@ -194,21 +200,17 @@ class StagingAPI(object):
         :return dictionary with ring names
         """
 
+        if self._ring_sourceinfos is None:
+            # both ring maps are built from one listing of every ring
+            with ThreadPoolExecutor(max_workers=len(self.rings) or 1) as executor:
+                self._ring_sourceinfos = list(executor.map(self._ring_sourceinfos_fetch, self.rings))
+
         ret = {}
         # puts except packages and it's origin project path
         except_pkgs = {}
 
-        for prj in self.rings:
-            query = {
-                'view': 'info',
-                'nofilename': '1'
-            }
-
-            url = self.makeurl(['source', prj], query)
-            root = http_GET(url)
-
-            for si in ET.parse(root).getroot().findall('sourceinfo'):
-                pkg = si.get('package')
+        for prj, sourceinfos in zip(self.rings, self._ring_sourceinfos):
+            for pkg, linked in sourceinfos:
                 if ':' in pkg:
                     continue
                 if pkg in ret:
@@ -228,15 +230,34 @@ class StagingAPI(object):
                 if checklinks:
                     if not prj.endswith('0-Bootstrap'):
                         continue
-                    for linked in si.findall('linked'):
-                        linked_prj = linked.get('project')
-                        linked_pkg = linked.get('package')
+                    for linked_prj, linked_pkg in linked:
                         if linked_prj != self.project and pkg != linked_pkg:
                             if linked_pkg not in ret:
                                 except_pkgs[linked_pkg] = linked_prj
                                 ret[linked_pkg] = prj
+
         return ret
 
+    def _ring_sourceinfos_fetch(self, project):
+        """
+        Packages of a ring and the packages they link to
+        :param project: ring project
+        :return list of package names and lists of linked project and package
+        """
+        query = {
+            'view': 'info',
+            'nofilename': '1'
+        }
+
+        url = self.makeurl(['source', project], query)
+        root = ET.parse(self.retried_GET(url)).getroot()
+
+        sourceinfos = []
+        for si in root.findall('sourceinfo'):
+            linked = [[linked.get('project'), linked.get('package')] for linked in si.findall('linked')]
+            sourceinfos.append([si.get('package'), linked])
+        return sourceinfos
+
     def _get_staged_requests(self):
         """
         Get all requests that are already staged
@@ -244,8 +265,11 @@ class StagingAPI(object):
         """
 
         packages_staged = {}
-        url = self.makeurl(['staging', self.project, 'staging_projects'], {'requests': 1})
-        status = ET.parse(self.retried_GET(url)).getroot()
+        if self._staging_snapshot_active:
+            status = self.snapshot().root
+        else:
+            url = self.makeurl(['staging', self.project, 'staging_projects'], {'requests': 1})
+            status = ET.parse(self.retried_GET(url)).getroot()
         for prj in status.findall('staging_project'):
             for req in prj.findall('./staged_requests/request'):
                 packages_staged[req.get('package')] = {'prj': prj.get('name'), 'rq_id': req.get('id')}
@@ -312,8 +336,11 @@ class StagingAPI(object):
         """
 
         result = []
-        url = self.makeurl(['staging', self.project, 'staging_projects'])
-        status = ET.parse(self.retried_GET(url)).getroot()
+        if self._staging_snapshot_active:
+            status = self.snapshot().root
+        else:
+            url = self.makeurl(['staging', self.project, 'staging_projects'])
+            status = ET.parse(self.retried_GET(url)).getroot()
         for project in status.findall('staging_project'):
             result.append(project.get('name'))
         return result
@@ -638,6 +665,9 @@ class StagingAPI(object):
         :param project: project the package is in
         :param package: package we want to query for
         """
+        if self._staging_snapshot_active:
+            return self.snapshot().request_for_package(project, package)
+
         data = self.project_status(project, status=False)
         for x in data.findall('staged_requests/request'):
             if x.get('package') == package:
@@ -650,6 +680,9 @@ class StagingAPI(object):
         :param project: project the package is in
         :param package: package we want to query for
         """
+        if self._staging_snapshot_active:
+            return self.snapshot().package_for_request(project, request_id)
+
         data = self.project_status(project, status=False)
         request_id = str(request_id)
         for x in data.findall('staged_requests/request'):
@@ -688,6 +721,7 @@ class StagingAPI(object):
         requestxml = f"<requests><request id='{request}'/></requests>"
         u = makeurl(self.apiurl, ['staging', project,
                                   'staging_projects', stage, 'staged_requests'])
+        self.snapshot_invalidate()
         return http_DELETE(u, data=requestxml)
 
     def is_package_disabled(self, project, package, store=False):
@@ -728,8 +762,11 @@ class StagingAPI(object):
         :return True (has ring packages) / False (has no ring packages)
         """
 
+        # one status call instead of one per request
+        data = self.project_status(project, status=False)
+        staged = {x.get('id'): x.get('package') for x in data.findall('staged_requests/request')}
         for request in requests:
-            pkg = self.get_package_for_request_id(project, request)
+            pkg = staged.get(str(request))
             if pkg in self.ring_packages:
                 return True
 
@@ -824,7 +861,61 @@ class StagingAPI(object):
 
         return log.getvalue()
 
+    @contextmanager
+    def staging_snapshot(self, status=False):
+        """
+        Serve project_status() and the lookups of staged requests from a
+        snapshot of all staging projects within the context.
+
+        Unless reload is requested, the snapshot is reused until it is dropped
+        by snapshot_invalidate() and fetched again on next use.
+        :param status: include the build status of the stagings right away
+        """
+        active = self._staging_snapshot_active
+        self._staging_snapshot_active = True
+        try:
+            if status:
+                self.snapshot(status=True)
+            yield
+        finally:
+            self._staging_snapshot_active = active
+            if not active:
+                self._staging_snapshot = None
+
+    def snapshot(self, status=False):
+        """
+        Requests of all staging projects, and their status if asked for,
+        fetched at once.
+
+        The snapshot is only kept within staging_snapshot().
+        :return StagingSnapshot
+        """
+        snapshot = self._staging_snapshot
+        if snapshot is not None and (snapshot.with_status or not status):
+            return snapshot
+
+        query = {'requests': 1}
+        if status:
+            query['status'] = 1
+        url = self.makeurl(['staging', self.project, 'staging_projects'], query)
+        snapshot = StagingSnapshot(ET.parse(self.retried_GET(url)).getroot(), status)
+        if self._staging_snapshot_active:
+            self._staging_snapshot = snapshot
+        return snapshot
+
+    def snapshot_invalidate(self):
+        """Drop the snapshot after modifying staging projects."""
+        self._staging_snapshot = None
+
     def project_status(self, staging, status=True, requests=True, reload=False):
+        if self._staging_snapshot_active and not reload and requests:
+            snapshot = self.snapshot(status)
+            if not staging:
+                return snapshot.root
+            root = snapshot.status(staging)
+            if root is not None:
+                return root
+
         opts = {}
         if requests:
             opts['requests'] = 1
@@ -925,6 +1016,7 @@ class StagingAPI(object):
             opts['remove_exclusion'] = 1
         u = makeurl(self.apiurl, ['staging', self.project, 'staging_projects', project, 'staged_requests'], opts)
         http_POST(u, data=requestxml)
+        self.snapshot_invalidate()
 
         if act_type == 'delete':
             self.delete_to_prj(act[0], project)
@@ -1488,6 +1580,7 @@ class StagingAPI(object):
             # if not using staging workflow, this will fail
             if e.code != 400:
                 raise e
+        self.snapshot_invalidate()
 
     def is_user_member_of(self, user, group):
         root = ET.fromstring(get_group(self.apiurl, group))
@@ -1540,3 +1633,4 @@ class StagingAPI(object):
                 delete_project(self.apiurl, project, force=True)
         except HTTPError as e:
             print(e)
+        self.snapshot_invalidate()
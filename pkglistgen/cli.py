@@ -13,7 +13,7 @@ from osc import conf
 from osclib.conf import Config
 from osclib.stagingapi import StagingAPI
 from pkglistgen.tool import PkgListGen, MismatchedRepoException
-from pkglistgen.update_repo_handler import update_project
+from pkglistgen.update_repo_handler import update_project, COMPRESS_JOBS, ZSTD_LEVEL
 
 
 class CommandLineInterface(ToolBase.CommandLineInterface):
@@ -32,6 +32,8 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         return tool
 
     @cmdln.option('--fixate', help='Set category to fixed and merge remaining files')
+    @cmdln.option('--zstd-level', type='int', default=ZSTD_LEVEL, help='zstd compression level of the package lists')
+    @cmdln.option('-j', '--jobs', type='int', default=COMPRESS_JOBS, help='number of package lists to compress in parallel')
     def do_handle_update_repos(self, subcmd, opts, project):
         """${cmd_name}: Update 00update-repos
 
@@ -40,7 +42,7 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         ${cmd_usage}
         ${cmd_option_list}
         """
-        return update_project(conf.config['apiurl'], project, opts.fixate)
+        return update_project(conf.config['apiurl'], project, opts.fixate, opts.zstd_level, opts.jobs)
 
     @cmdln.option('-f', '--force', action='store_true', help='continue even if build is in progress')
     @cmdln.option('-p', '--project', help='target project')
@@ -49,6 +51,8 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
     @cmdln.option('--stop-after-solve', action='store_true', help='only create group files')
     @cmdln.option('--staging', help='Only solve that one staging')
     @cmdln.option('--only-release-packages', action='store_true', help='Generate 000release-packages only')
+    @cmdln.option('--report', metavar='FILE', help='write phase and solve timings as JSON to FILE')
+    @cmdln.option('--profile', metavar='DIR', help='store cProfile output of the heavy phases in DIR')
     def do_update_and_solve(self, subcmd, opts):
         """${cmd_name}: update and solve for given scope
 
@@ -87,20 +91,25 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
             os.environ['OBS_NAME'] = 'build.opensuse.org'
 
         def solve_project(project, scope: str):
+            self.tool.reset()
+            self.tool.dry_run = self.options.dry
+            self.tool.report.profile_dir = opts.profile
             try:
-                self.tool.reset()
-                self.tool.dry_run = self.options.dry
-                return self.tool.update_and_solve_target(api, target_project, target_config, main_repo,
-                                                         project=project, scope=scope, force=opts.force,
-                                                         no_checkout=opts.no_checkout,
-                                                         only_release_packages=opts.only_release_packages,
-                                                         stop_after_solve=opts.stop_after_solve)
+                with self.tool.report.count_requests():
+                    return self.tool.update_and_solve_target(api, target_project, target_config, main_repo,
+                                                             project=project, scope=scope, force=opts.force,
+                                                             no_checkout=opts.no_checkout,
+                                                             only_release_packages=opts.only_release_packages,
+                                                             stop_after_solve=opts.stop_after_solve)
             except MismatchedRepoException:
                 logging.error("Failed to create weakremovers.inc due to mismatch in repos - project most likey started building again.")
                 # for stagings we have to be strict on the exit value
                 if scope == 'staging':
                     return 1
                 return 0
+            finally:
+                if opts.report:
+                    self.tool.report.write(opts.report)
 
         scope = opts.scope
         if scope.startswith('staging:'):
@@ -236,6 +236,9 @@ class Group(object):
 
             end = time.time()
             self.logger.info('%s - solving took %f', self.name, end - start)
+            self.pkglist.report.solve(self.name, arch, end - start, self.pkglist.solvables.get(arch),
+                                      packages=len(solved[arch]),
+                                      unresolvable=len(self.unresolvable[arch]))
 
         common = None
         # compute common packages across all architectures
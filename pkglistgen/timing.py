@@ -0,0 +1,94 @@
+import cProfile
+import json
+import logging
+import os
+import time
+
+from contextlib import contextmanager
+
+import osc.connection
+
+
+class RequestCounter(object):
+    """Count HTTP requests issued through osc while enabled."""
+
+    def __init__(self):
+        self.count = 0
+        self._original = None
+
+    def __enter__(self):
+        self._original = osc.connection.http_request
+
+        def http_request(*args, **kwargs):
+            self.count += 1
+            return self._original(*args, **kwargs)
+
+        osc.connection.http_request = http_request
+        return self
+
+    def __exit__(self, *args):
+        osc.connection.http_request = self._original
+        self._original = None
+
+
+class PhaseReport(object):
+    """Collect durations, solvable and OBS request counts of pkglistgen phases.
+
+    Phases may nest, every phase is recorded as a flat entry in the order it
+    finished. Phases marked as heavy are additionally run under cProfile when
+    a profile directory is set.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.logger = logging.getLogger(__name__)
+        self.phases = []
+        self.solves = []
+        self.counter = None
+
+    def requests(self):
+        return self.counter.count if self.counter else 0
+
+    @contextmanager
+    def phase(self, name, heavy=False, **data):
+        profile = None
+        if heavy and self.profile_dir:
+            profile = cProfile.Profile()
+
+        requests = self.requests()
+        start = time.time()
+        if profile:
+            profile.enable()
+        try:
+            yield data
+        finally:
+            if profile:
+                profile.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(self.profile_dir, '{}.prof'.format(name)))
+            duration = time.time() - start
+            entry = {'phase': name, 'seconds': round(duration, 3), 'requests': self.requests() - requests}
+            entry.update(data)
+            self.phases.append(entry)
+            self.logger.info('%s took %f', name, duration)
+
+    def solve(self, group, arch, duration, solvables, **data):
+        entry = {'group': group, 'arch': arch, 'seconds': round(duration, 3), 'solvables': solvables}
+        entry.update(data)
+        self.solves.append(entry)
+
+    @contextmanager
+    def count_requests(self):
+        with RequestCounter() as counter:
+            self.counter = counter
+            try:
+                yield
+            finally:
+                self.counter = None
+
+    def dump(self):
+        return {'phases': self.phases, 'solves': self.solves}
+
+    def write(self, filename):
+        with open(filename, 'w') as fh:
+            json.dump(self.dump(), fh, indent=2)
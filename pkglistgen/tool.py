@@ -30,6 +30,7 @@ from urllib.parse import urlparse
 
 from pkglistgen import file_utils
 from pkglistgen.group import Group
+from pkglistgen.timing import PhaseReport
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 
@@ -59,6 +60,9 @@ class PkgListGen(ToolBase.ToolBase):
         self.input_dir = '.'
         self.output_dir = '.'
         self.lockjobs = dict()
+        # arch -> number of solvables in the last prepared pool
+        self.solvables = dict()
+        self.report = PhaseReport()
         self.ignore_broken = False
         self.unwanted = set()
         self.output = None
@@ -222,6 +226,7 @@ class PkgListGen(ToolBase.ToolBase):
             pool.setarch(arch)
 
         self.lockjobs[arch] = []
+        self.solvables[arch] = 0
         solvables = set()
 
         for project, reponame in self.repos:
@@ -241,6 +246,7 @@ class PkgListGen(ToolBase.ToolBase):
                 if not self.use_newest_version and solvable.name in solvables:
                     self.lockjobs[arch].append(pool.Job(solv.Job.SOLVER_SOLVABLE | solv.Job.SOLVER_LOCK, solvable.id))
                 solvables.add(solvable.name)
+                self.solvables[arch] += 1
 
         pool.addfileprovides()
         pool.createwhatprovides()
@@ -541,7 +547,8 @@ class PkgListGen(ToolBase.ToolBase):
             includes = settings.get('includes', [])
             excludes = settings.get('excludes', [])
             use_recommends = settings.get('recommends', global_use_recommends)
-            self.solve_module(groupname, includes, excludes, use_recommends)
+            with self.report.phase('solve_module', group=groupname):
+                self.solve_module(groupname, includes, excludes, use_recommends)
             g = self.groups[groupname]
             # the default is a little double negated but Factory has ignore_broken
             # as default and we only disable it for single groups (for now)
@@ -570,8 +577,10 @@ class PkgListGen(ToolBase.ToolBase):
                     for p in overlapped:
                         module.solved_packages[arch].pop(p, None)
 
-        self._collect_unsorted_packages(modules, self.groups.get('unsorted'))
-        return self.write_all_groups()
+        with self.report.phase('collect_unsorted_packages'):
+            self._collect_unsorted_packages(modules, self.groups.get('unsorted'))
+        with self.report.phase('write_all_groups'):
+            return self.write_all_groups()
 
     def strip_medium_from_staging(self, path):
         # staging projects don't need source and debug medium - and the glibc source
@@ -675,12 +684,13 @@ class PkgListGen(ToolBase.ToolBase):
         self.input_dir = group_dir
         self.output_dir = product_dir
 
-        for package in checkout_list:
-            if no_checkout:
-                logging.debug('Skipping checkout of {}/{}'.format(project, package))
-                continue
-            checkout_package(api.apiurl, project, package, expand_link=True,
-                             prj_dir=cache_dir, outdir=os.path.join(cache_dir, package))
+        with self.report.phase('checkout'):
+            for package in checkout_list:
+                if no_checkout:
+                    logging.debug('Skipping checkout of {}/{}'.format(project, package))
+                    continue
+                checkout_package(api.apiurl, project, package, expand_link=True,
+                                 prj_dir=cache_dir, outdir=os.path.join(cache_dir, package))
 
         file_utils.unlink_all_except(release_dir, ['weakremovers.inc'])
         if not only_release_packages:
@@ -694,18 +704,20 @@ class PkgListGen(ToolBase.ToolBase):
         logging.debug('-> do_update')
         # make sure we only calculcate existant architectures
         self.filter_architectures(target_archs(api.apiurl, project, main_repo))
-        self.update_repos(self.filtered_architectures)
+        with self.report.phase('update_repos', heavy=True):
+            self.update_repos(self.filtered_architectures)
 
         if only_release_packages:
             self.load_all_groups()
             self.write_group_stubs()
         else:
-            summary = self.solve_project(
-                ignore_unresolvable=str2bool(target_config.get('pkglistgen-ignore-unresolvable')),
-                ignore_recommended=str2bool(target_config.get('pkglistgen-ignore-recommended')),
-                locale=target_config.get('pkglistgen-locale'),
-                locales_from=target_config.get('pkglistgen-locales-from')
-            )
+            with self.report.phase('solve_project', heavy=True):
+                summary = self.solve_project(
+                    ignore_unresolvable=str2bool(target_config.get('pkglistgen-ignore-unresolvable')),
+                    ignore_recommended=str2bool(target_config.get('pkglistgen-ignore-recommended')),
+                    locale=target_config.get('pkglistgen-locale'),
+                    locales_from=target_config.get('pkglistgen-locales-from')
+                )
 
         if stop_after_solve:
             return
@@ -713,7 +725,8 @@ class PkgListGen(ToolBase.ToolBase):
         if drop_list and not only_release_packages:
             weakremovers_file = os.path.join(release_dir, 'weakremovers.inc')
             try:
-                self.create_weakremovers(project, target_config, oldrepos_dir, output=open(weakremovers_file, 'w'))
+                with self.report.phase('weakremovers', heavy=True):
+                    self.create_weakremovers(project, target_config, oldrepos_dir, output=open(weakremovers_file, 'w'))
             except MismatchedRepoException:
                 logging.error("Failed to create weakremovers.inc due to mismatch in repos - project most likey started building again.")
                 return
@@ -726,10 +739,11 @@ class PkgListGen(ToolBase.ToolBase):
         if not product_version:
             # for stagings the product version doesn't matter (I hope)
             product_version = '1'
-        for product_file in glob.glob(os.path.join(product_dir, '*.product')):
-            self.replace_product_version(product_file, product_version)
-            logging.debug(subprocess.check_output(
-                [PRODUCT_SERVICE, product_file, product_dir, project], encoding='utf-8'))
+        with self.report.phase('product_service'):
+            for product_file in glob.glob(os.path.join(product_dir, '*.product')):
+                self.replace_product_version(product_file, product_version)
+                logging.debug(subprocess.check_output(
+                    [PRODUCT_SERVICE, product_file, product_dir, project], encoding='utf-8'))
 
         for delete_kiwi in target_config.get('pkglistgen-delete-kiwis-{}'.format(scope), '').split(' '):
             delete_kiwis = glob.glob(os.path.join(product_dir, delete_kiwi))
@@ -752,7 +766,8 @@ class PkgListGen(ToolBase.ToolBase):
 
         file_utils.multibuild_from_glob(release_dir, '*.spec')
         self.build_stub(release_dir, 'spec')
-        self.commit_package(release_dir)
+        with self.report.phase('commit', package=release):
+            self.commit_package(release_dir)
 
         if only_release_packages:
             return
@@ -772,7 +787,8 @@ class PkgListGen(ToolBase.ToolBase):
                 for line in sorted(output):
                     f.write(line + '\n')
 
-        self.commit_package(product_dir)
+        with self.report.phase('commit', package=product):
+            self.commit_package(product_dir)
 
         if os.path.isfile(reference_summary):
             return self.comment.handle_package_diff(project, reference_summary, summary_file)
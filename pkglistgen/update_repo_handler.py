@@ -1,8 +1,7 @@
 
 import glob
-import gzip
 import hashlib
-import io
+import json
 import logging
 import os.path
 import re
@@ -15,6 +14,8 @@ import tempfile
 import requests
 import solv
 import yaml
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree as ET
 
 import osc.core
@@ -25,6 +26,51 @@ from urllib.parse import urljoin, urlparse
 
 logger = logging.getLogger()
 
+CHUNK_SIZE = 1024 * 1024
+ZSTD_LEVEL = 19
+COMPRESS_JOBS = 4
+REPOMD_NS = {'r': 'http://linux.duke.edu/metadata/repo'}
+
+# parsed repositories keyed by their checksum or by their url (with an etag file)
+SOLV_CACHEDIR = CacheManager.directory('update_repo_handler-solv')
+
+
+def stream_to_file(response, fh, digest=None, decompress=False):
+    """Write a streamed response into fh with constant memory usage.
+
+    The raw data is fed into digest while it is downloaded and gzip content is
+    inflated chunk by chunk. The file is rewound for handing it to libsolv.
+    """
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if decompress else None
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if digest:
+            digest.update(chunk)
+        if inflate:
+            data = inflate.decompress(chunk)
+            # concatenated gzip members
+            while inflate.eof and inflate.unused_data:
+                unused = inflate.unused_data
+                inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data += inflate.decompress(unused)
+            chunk = data
+        fh.write(chunk)
+    if inflate:
+        fh.write(inflate.flush())
+    fh.flush()
+    os.lseek(fh.fileno(), 0, os.SEEK_SET)
+
+
+def cached_solv_path(key):
+    return os.path.join(SOLV_CACHEDIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.solv')
+
+
+def store_solv(repo, path):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    ofh = solv.xfopen(tmp, 'w')
+    repo.write(ofh)
+    ofh.close()
+    os.rename(tmp, path)
+
 
 def dump_solv_build(baseurl):
     """Determine repo format and build string from remote repository."""
@@ -64,14 +110,30 @@ def dump_solv_build(baseurl):
     raise Exception(baseurl + 'includes no build number')
 
 
-def parse_repomd(repo, baseurl):
+def fetch_repomd(baseurl):
+    """Return the content of repomd.xml or None for non rpm-md repos."""
     url = urljoin(baseurl, 'repodata/repomd.xml')
-    repomd = requests.get(url)
-    if repomd.status_code != requests.codes.ok:
+    with requests.get(url) as repomd:
+        if repomd.status_code != requests.codes.ok:
+            return None
+        return repomd.content
+
+
+def repomd_checksum(repomd):
+    """Return the checksum of the primary metadata or None for non rpm-md repos."""
+    if repomd is None:
+        return None
+    root = ET.fromstring(repomd)
+    checksum = root.find('.//r:data[@type="primary"]/r:checksum', REPOMD_NS)
+    return checksum.text if checksum is not None else None
+
+
+def parse_repomd(repo, baseurl, repomd):
+    if repomd is None:
         return False
 
-    ns = {'r': 'http://linux.duke.edu/metadata/repo'}
-    root = ET.fromstring(repomd.content)
+    ns = REPOMD_NS
+    root = ET.fromstring(repomd)
     primary_element = root.find('.//r:data[@type="primary"]', ns)
     location = primary_element.find('r:location', ns).get('href')
     sha256_or_512 = 0
@@ -82,8 +144,14 @@ def parse_repomd(repo, baseurl):
         sha_expected = primary_element.find('r:checksum[@type="sha256"]', ns).text
         sha256_or_512 = 256
 
+    # the primary checksum identifies the content, no need to download it again
+    cached = cached_solv_path(sha_expected)
+    if os.path.exists(cached):
+        logger.debug('using cached %s for %s', cached, baseurl)
+        return repo.add_solv(cached)
+
     f = tempfile.TemporaryFile()
-    f.write(repomd.content)
+    f.write(repomd)
     f.flush()
     os.lseek(f.fileno(), 0, os.SEEK_SET)
     repo.add_repomdxml(solv.xfopen_fd(None, f.fileno()), 0)
@@ -92,19 +160,18 @@ def parse_repomd(repo, baseurl):
         if primary.status_code != requests.codes.ok:
             raise Exception(url + ' does not exist')
         if sha256_or_512 == 512:
-            sha = hashlib.sha512(primary.content).hexdigest()
+            digest = hashlib.sha512()
         else:
-            sha = hashlib.sha256(primary.content).hexdigest()
+            digest = hashlib.sha256()
 
+        primary_file = tempfile.TemporaryFile()
+        stream_to_file(primary, primary_file, digest, decompress=True)
+        sha = digest.hexdigest()
         if sha != sha_expected:
             raise Exception('checksums do not match {} != {}'.format(sha, sha_expected))
 
-        content = gzip.GzipFile(fileobj=io.BytesIO(primary.content))
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(content.read())
-        f.flush()
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        repo.add_rpmmd(solv.xfopen_fd(None, f.fileno()), None, 0)
+        repo.add_rpmmd(solv.xfopen_fd(None, primary_file.fileno()), None, 0)
+        store_solv(repo, cached)
         return True
 
     return False
@@ -119,39 +186,62 @@ def parse_susetags(repo, baseurl):
     f = tempfile.TemporaryFile()
     f.write(content.content)
     f.flush()
-    os.lseek(f.fileno(), 0, os.SEEK_SET)
-    repo.add_content(solv.xfopen_fd(None, f.fileno()), 0)
 
-    defvendorid = repo.meta.lookup_id(solv.SUSETAGS_DEFAULTVENDOR)
-    descrdir = repo.meta.lookup_str(solv.SUSETAGS_DESCRDIR)
+    # the cached solv file contains the content already, so only look up the
+    # descr dir in a scratch pool until it is clear the cache is not used
+    os.lseek(f.fileno(), 0, os.SEEK_SET)
+    pool = solv.Pool()
+    scratch = pool.add_repo('content')
+    scratch.add_content(solv.xfopen_fd(None, f.fileno()), 0)
+    descrdir = scratch.meta.lookup_str(solv.SUSETAGS_DESCRDIR)
     if not descrdir:
         descrdir = 'suse/setup/descr'
 
     url = urljoin(baseurl, descrdir + '/packages.gz')
-    with requests.get(url, stream=True) as packages:
+
+    # susetags has no checksum to compare, so rely on the etag of the last download
+    cached = cached_solv_path(url)
+    etag_file = cached + '.etag'
+    headers = {}
+    if os.path.exists(cached) and os.path.exists(etag_file):
+        with open(etag_file) as fh:
+            headers['If-None-Match'] = fh.read().strip()
+
+    with requests.get(url, stream=True, headers=headers) as packages:
+        if packages.status_code == requests.codes.not_modified:
+            logger.debug('using cached %s for %s', cached, url)
+            return repo.add_solv(cached)
         if packages.status_code != requests.codes.ok:
             raise Exception(url + ' does not exist')
 
-        content = gzip.GzipFile(fileobj=io.BytesIO(packages.content))
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(content.read())
-        f.flush()
         os.lseek(f.fileno(), 0, os.SEEK_SET)
+        repo.add_content(solv.xfopen_fd(None, f.fileno()), 0)
+        defvendorid = repo.meta.lookup_id(solv.SUSETAGS_DEFAULTVENDOR)
+
+        packages_file = tempfile.TemporaryFile()
+        stream_to_file(packages, packages_file, decompress=True)
         try:
-            repo.add_susetags(f, defvendorid, None, solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.SUSETAGS_RECORD_SHARES)
+            repo.add_susetags(packages_file, defvendorid, None, solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.SUSETAGS_RECORD_SHARES)
         except TypeError:
             logger.error(f"Failed to add susetags for {url}")
             return False
+
+        etag = packages.headers.get('ETag')
+        if etag:
+            repo.internalize()
+            store_solv(repo, cached)
+            with open(etag_file, 'w') as fh:
+                fh.write(etag)
         return True
     return False
 
 
-def dump_solv(name, baseurl):
+def dump_solv(name, baseurl, repomd):
     pool = solv.Pool()
     pool.setarch()
 
     repo = pool.add_repo(''.join(random.choice(string.ascii_letters) for _ in range(5)))
-    if not parse_repomd(repo, baseurl) and not parse_susetags(repo, baseurl):
+    if not parse_repomd(repo, baseurl, repomd) and not parse_susetags(repo, baseurl):
         raise Exception('neither repomd nor susetags exists in ' + baseurl)
 
     repo.create_stubs()
@@ -217,7 +307,46 @@ def merge_susetags(output, files):
         print('-Prv:', file=output_file)
 
 
-def fixate_target(root, package, fixate):
+def zstd_command(level):
+    command = ['zstd', '-{}'.format(level), '--rm']
+    if level > 19:
+        command.insert(1, '--ultra')
+    return command
+
+
+def compress_files(files, level=ZSTD_LEVEL, jobs=COMPRESS_JOBS):
+    """Compress files with zstd in parallel, replacing the originals."""
+    def compress(file):
+        subprocess.check_call(zstd_command(level) + [file])
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # consume the results to raise errors of the workers
+        list(executor.map(compress, files))
+
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def save_state(state_file, state):
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.rename(state_file + '.tmp', state_file)
+
+
+def repo_unchanged(record, repo_dir, build, checksum):
+    """Check the stored state of a repository url against the remote one."""
+    if not record or not os.path.exists(os.path.join(repo_dir, record['file'])):
+        return False
+    if build and record.get('build') == build:
+        return True
+    return checksum is not None and record.get('checksum') == checksum
+
+
+def fixate_target(root, package, fixate, zstd_level=ZSTD_LEVEL):
     for item in root:
         key = list(item)[0]
         opts = item[key]
@@ -233,7 +362,7 @@ def fixate_target(root, package, fixate):
             for file in oldfiles:
                 os.unlink(file)
                 package.delete_file(os.path.basename(file))
-            subprocess.check_call(['zstd', '-19', '--rm', newfile])
+            subprocess.check_call(zstd_command(zstd_level) + [newfile])
             package.addfile(os.path.basename(newfile) + ".zst")
     ystring = yaml.dump(root, default_flow_style=False)
     with open(os.path.join(package.dir, 'config.yml'), 'w') as f:
@@ -249,11 +378,15 @@ def target_files(repo_dir, key):
     return files
 
 
-def update_project(apiurl, project, fixate=None):
+def update_project(apiurl, project, fixate=None, zstd_level=ZSTD_LEVEL, jobs=COMPRESS_JOBS):
     # Cache dir specific to hostname and project.
     host = urlparse(apiurl).hostname
     cache_dir = CacheManager.directory('update_repo_handler', host, project)
     repo_dir = os.path.join(cache_dir, '000update-repos')
+    # url -> build, primary checksum and output file of the last update,
+    # kept outside of cache_dir as that is wiped for every checkout
+    state_file = os.path.join(CacheManager.directory('update_repo_handler-state', host), project + '.json')
+    state = load_state(state_file)
 
     # development aid
     checkout = True
@@ -268,8 +401,9 @@ def update_project(apiurl, project, fixate=None):
 
     root = yaml.safe_load(open(os.path.join(repo_dir, 'config.yml')))
     if fixate:
-        return fixate_target(root, package, fixate)
+        return fixate_target(root, package, fixate, zstd_level)
 
+    compress = []
     for item in root:
         key = list(item)[0]
         opts = item[key]
@@ -297,15 +431,23 @@ def update_project(apiurl, project, fixate=None):
                 for file in oldfiles:
                     os.unlink(file)
                     package.delete_file(os.path.basename(file))
-                subprocess.check_call(['zstd', '-19', '--rm', oldest])
+                subprocess.check_call(zstd_command(zstd_level) + [oldest])
                 package.addfile(os.path.basename(oldest) + ".zst")
 
         if os.path.exists(packages_file + '.zst') or os.path.exists(packages_file + '.xz'):
             print(path, 'already exists')
             continue
 
+        # fetched once for the state check and for parsing
+        repomd = fetch_repomd(opts['url'])
+        checksum = repomd_checksum(repomd)
+        record = state.get(opts['url'])
+        if repo_unchanged(record, repo_dir, opts.get('build'), checksum):
+            print(path, 'unchanged since', record['file'])
+            continue
+
         solv_file = packages_file + '.solv'
-        dump_solv(solv_file, opts['url'])
+        dump_solv(solv_file, opts['url'], repomd)
 
         pool = solv.Pool()
         pool.setarch()
@@ -317,11 +459,16 @@ def update_project(apiurl, project, fixate=None):
         repo1 = pool.add_repo(''.join(random.choice(string.ascii_letters) for _ in range(5)))
         repo1.add_solv(solv_file)
 
-        print_repo_delta(pool, repo1, open(packages_file, 'w'))
-        subprocess.call(['zstd', '-19', '--rm', packages_file])
+        with open(packages_file, 'w') as f:
+            print_repo_delta(pool, repo1, f)
         os.unlink(solv_file)
-
-        package.addfile(os.path.basename(path + '.zst'))
+        compress.append(packages_file)
+        state[opts['url']] = {'build': opts.get('build'), 'checksum': checksum, 'file': path + '.zst'}
         del pool
 
+    compress_files(compress, zstd_level, jobs)
+    for packages_file in compress:
+        package.addfile(os.path.basename(packages_file) + '.zst')
+
     package.commit('Automatic update')
+    save_state(state_file, state)
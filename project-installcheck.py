@@ -5,13 +5,13 @@ import hashlib
 import logging
 import os
 import os.path
-import subprocess
 import sys
 import tempfile
 import cmdln
 import dateutil.parser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 
 import yaml
 from lxml import etree as ET
@@ -19,21 +19,27 @@ from osc import conf
 from osc.core import http_request
 
 import ToolBase
+from osclib.cache_manager import CacheManager
 from osclib.conf import Config
-from osclib.core import (http_DELETE, http_GET, makeurl,
+from osclib.core import (http_DELETE, http_GET, makeurl, repositories_states,
                          repository_path_expand, repository_path_search,
                          target_archs, source_file_load, source_file_ensure)
-from osclib.repochecks import mirror, parsed_installcheck, CorruptRepos
-from osclib.comments import CommentAPI
+from osclib.repochecks import installcheck_state_file, mirror, parsed_installcheck
+from osclib.comments import BatchedCommentAPI
+from osclib.util import sha1_short
 
 
 class RepoChecker():
+    JOBS = 8
+
     def __init__(self):
         self.logger = logging.getLogger('RepoChecker')
         self.store_project = None
         self.store_package = None
         self.rebuild = None
         self.comment = None
+        self.incremental = False
+        self.jobs = self.JOBS
 
     def parse_store(self, project_package):
         if project_package:
@@ -83,7 +89,8 @@ class RepoChecker():
             url = makeurl(self.apiurl, ['comment', comment.get('id')])
             http_DELETE(url)
 
-        commentapi = CommentAPI(self.apiurl)
+        commentapi = BatchedCommentAPI(self.apiurl)
+        commentapi.prefetch([{'project_name': self.project, 'package_name': package} for package in comments])
         MARKER = 'Installcheck'
 
         for package in comments:
@@ -104,6 +111,45 @@ class RepoChecker():
             self.logger.debug("Adding comment to {}/{}".format(self.project, package))
             commentapi.add_comment(project_name=self.project, package_name=package, comment=newcomment)
 
+        commentapi.flush()
+
+    def _replace_followups(self, parsed):
+        """
+        Replace the problem lines of a package that are the complete problem
+        of another package by FOLLOWUP(other) and join the lines.
+
+        Blocks are indexed by their first line, so every line is only compared
+        with the blocks starting with it instead of every package's output.
+        Packages with identical problems refer to the first of them.
+        """
+        blocks = {}
+        for package, entry in parsed.items():
+            block = tuple(entry['output'])
+            if len(block):
+                blocks.setdefault(block, package)
+
+        by_first_line = {}
+        for block, package in blocks.items():
+            by_first_line.setdefault(block[0], []).append((block, package))
+        for candidates in by_first_line.values():
+            # prefer the longest match
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+
+        for package, entry in parsed.items():
+            lines = entry['output']
+            output = []
+            i = 0
+            while i < len(lines):
+                for block, other in by_first_line.get(lines[i], ()):
+                    if other != package and tuple(lines[i:i + len(block)]) == block:
+                        output.append('FOLLOWUP(' + other + ')')
+                        i += len(block)
+                        break
+                else:
+                    output.append(lines[i])
+                    i += 1
+            entry['output'] = "\n".join(output)
+
     def _split_and_filter(self, output):
         output = output.split("\n")
         for lnr, line in enumerate(output):
@@ -190,39 +236,12 @@ class RepoChecker():
             else:
                 primaryxmls.append(mirrored)
 
-        parsed = dict()
-        with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
-            pfile = os.path.join(dir, 'packages')
-
-            SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
-            script = os.path.join(SCRIPT_PATH, 'write_repo_susetags_file.pl')
-            parts = ['perl', script, dir] + directories
-
-            p = subprocess.run(parts)
-            if p.returncode:
-                # technically only 126, but there is no other value atm -
-                # so if some other perl error happens, we don't continue
-                raise CorruptRepos
+        state_file = None
+        if self.incremental:
+            state_file = installcheck_state_file(self.apiurl, project, repository, arch, directories + primaryxmls)
+        parsed = parsed_installcheck(directories + primaryxmls, arch, None, [], state_file=state_file)
 
-            target_packages = {}
-            with open(os.path.join(dir, 'catalog.yml')) as file:
-                catalog = yaml.safe_load(file)
-                if catalog is not None:
-                    target_packages = catalog.get(directories[0], [])
-
-            parsed = parsed_installcheck([pfile] + primaryxmls, arch, target_packages, [])
-
-        for package in parsed:
-            parsed[package]['output'] = "\n".join(parsed[package]['output'])
-
-        # let's risk a N*N algorithm in the hope that we have a limited N
-        for package1 in parsed:
-            output = parsed[package1]['output']
-            for package2 in parsed:
-                if package1 == package2:
-                    continue
-                output = output.replace(parsed[package2]['output'], 'FOLLOWUP(' + package2 + ')')
-            parsed[package1]['output'] = output
+        self._replace_followups(parsed)
 
         for package in parsed:
             parsed[package]['output'] = self._split_and_filter(parsed[package]['output'])
@@ -293,38 +312,43 @@ class RepoChecker():
 
         # first round: collect all infos from obs
         infos = dict()
-        for package in packages:
-            subpacks, build_deps = self.check_leaf_package(project, repository, arch, package)
-            infos[package] = {'subpacks': subpacks, 'deps': build_deps}
+        if len(packages):
+            state = self.buildinfo_state(project, repository, arch, repository_pairs)
+            for package, (subpacks, build_deps) in zip(packages, self.check_leaf_packages(
+                    project, repository, arch, packages, state)):
+                infos[package] = {'subpacks': subpacks, 'deps': build_deps}
 
         # calculate rebuild triggers
+        subpack_index = dict()
+        for package in packages:
+            for subpack in infos[package]['subpacks']:
+                subpack_index.setdefault(subpack, []).append(package)
+
         rebuild_triggers = dict()
-        for package1 in packages:
-            for package2 in packages:
-                if package1 == package2:
-                    continue
-                for subpack in infos[package1]['subpacks']:
-                    if subpack in infos[package2]['deps']:
-                        rebuild_triggers.setdefault(package1, set())
-                        rebuild_triggers[package1].add(package2)
-                        # ignore this depencency. we already trigger both of them
-                        del infos[package2]['deps'][subpack]
+        for package2 in packages:
+            for bdep in list(infos[package2]['deps']):
+                for package1 in subpack_index.get(bdep, ()):
+                    if package1 == package2:
+                        continue
+                    rebuild_triggers.setdefault(package1, set())
+                    rebuild_triggers[package1].add(package2)
+                    # ignore this depencency. we already trigger both of them
+                    del infos[package2]['deps'][bdep]
+                    break
 
         # calculate build info hashes
         for package in packages:
             if buildresult[package] != 'succeeded':
                 self.logger.debug("Ignore %s for the moment, %s", package, buildresult[package])
                 continue
-            m = hashlib.sha256()
-            for bdep in sorted(infos[package]['deps']):
-                m.update(bytes(bdep + '-' + infos[package]['deps'][bdep], 'utf-8'))
+            digest = self.buildinfo_digest(infos[package]['deps'])
             state_key = '{}/{}/{}/{}'.format(project, repository, arch, package)
             olddigest = oldstate['leafs'].get(state_key, {}).get('buildinfo')
-            if olddigest == m.hexdigest():
+            if olddigest == digest:
                 continue
-            self.logger.info("rebuild leaf package %s (%s vs %s)", package, olddigest, m.hexdigest())
+            self.logger.info("rebuild leaf package %s (%s vs %s)", package, olddigest, digest)
             rebuilds.add(package)
-            oldstate['leafs'][state_key] = {'buildinfo': m.hexdigest(),
+            oldstate['leafs'][state_key] = {'buildinfo': digest,
                                             'rebuild': str(datetime.now())}
 
         if self.dryrun:
@@ -346,9 +370,42 @@ class RepoChecker():
         self.store_yaml(oldstate)
         return oldstate
 
-    def check_leaf_package(self, project, repository, arch, package):
-        url = makeurl(self.apiurl, ['build', project, repository, arch, package, '_buildinfo'])
-        root = ET.parse(http_GET(url)).getroot()
+    def buildinfo_state(self, project, repository, arch, repository_pairs):
+        """
+        Key of the build infos of a repository, they change with the binaries
+        in the build path, the project config of the path and the project meta.
+        """
+        states = repositories_states(self.apiurl, repository_pairs, [arch])
+        for path in (['build', project, repository, '_buildconfig'], ['source', project, '_meta']):
+            states.append(hashlib.sha1(http_GET(makeurl(self.apiurl, path)).read()).hexdigest())
+        return sha1_short(states)
+
+    def check_leaf_packages(self, project, repository, arch, packages, state):
+        """Subpacks and build dependencies of the packages, fetched concurrently."""
+        def check(package):
+            return self.check_leaf_package(project, repository, arch, package, state)
+
+        if self.jobs < 2 or len(packages) < 2:
+            return [check(package) for package in packages]
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(check, packages))
+
+    def check_leaf_package(self, project, repository, arch, package, state=None):
+        if state:
+            directory = CacheManager.directory('buildinfo', urlparse(self.apiurl).hostname,
+                                               project, repository, arch, state)
+            path = os.path.join(directory, package + '.xml')
+        if not state or not os.path.exists(path):
+            url = makeurl(self.apiurl, ['build', project, repository, arch, package, '_buildinfo'])
+            content = http_GET(url).read()
+            if not state:
+                return self.parse_buildinfo(ET.fromstring(content))
+            with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+                f.write(content)
+            os.rename(f.name, path)
+        return self.parse_buildinfo(ET.parse(path).getroot())
+
+    def parse_buildinfo(self, root):
         subpacks = set()
         for sp in root.findall('subpack'):
             subpacks.add(sp.text)
@@ -359,6 +416,14 @@ class RepoChecker():
             build_deps[bd.get('name')] = bd.get('version') + '-' + bd.get('release')
         return subpacks, build_deps
 
+    def buildinfo_digest(self, build_deps):
+        m = hashlib.sha256()
+        for bdep in sorted(build_deps):
+            m.update(bdep.encode('utf-8'))
+            m.update(b'-')
+            m.update(build_deps[bdep].encode('utf-8'))
+        return m.hexdigest()
+
 
 class CommandLineInterface(ToolBase.CommandLineInterface):
 
@@ -372,6 +437,9 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
     @cmdln.option('-r', '--repo', dest='repo', help='Repository to check')
     @cmdln.option('--add-comments', dest='comments', action='store_true', help='Create comments about issues')
     @cmdln.option('--no-rebuild', dest='norebuild', action='store_true', help='Only track issues, do not rebuild')
+    @cmdln.option('--incremental', action='store_true', help='Only recheck packages affected by changed binaries')
+    @cmdln.option('-j', '--jobs', type='int', default=RepoChecker.JOBS,
+                  help='number of leaf package build infos to fetch in parallel')
     def do_check(self, subcmd, opts, project):
         """${cmd_name}: Rebuild packages in rebuild=local projects
 
@@ -380,6 +448,8 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         """
         self.tool.rebuild = not opts.norebuild
         self.tool.comment = opts.comments
+        self.tool.incremental = opts.incremental
+        self.tool.jobs = opts.jobs
         self.tool.parse_store(opts.store)
         self.tool.apiurl = conf.config['apiurl']
         self.tool.check(project, opts.repo)
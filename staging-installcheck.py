@@ -2,10 +2,13 @@
 
 import argparse
 import logging
+import multiprocessing
 import os
 import re
 import sys
+import threading
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from urllib.error import HTTPError
 
 import osc.core
@@ -15,16 +18,19 @@ from lxml import etree as ET
 from osclib.comments import CommentAPI
 from osclib.conf import Config
 from osclib.conf import str2bool
-from osclib.core import (builddepinfo, depends_on, duplicated_binaries_in_repo,
-                         fileinfo_ext_all, repository_arch_state,
-                         repository_path_expand, target_archs)
+from osclib.core import (builddepgraph, depends_on, duplicated_binaries_in_repo,
+                         repository_arch_state, repository_path_expand,
+                         target_archs)
+from osclib.fileinfo import FileInfoService
 
-from osclib.repochecks import installcheck, mirror
+from osclib.repochecks import installcheck, installcheck_state_file, mirror
 from osclib.stagingapi import StagingAPI
 from osclib.memoize import memoize
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 CheckResult = namedtuple('CheckResult', ('success', 'comment'))
+# buildids is None if there is nothing to report
+StagingResult = namedtuple('StagingResult', ('success', 'comment', 'buildids'))
 
 
 class InstallChecker(object):
@@ -45,6 +51,16 @@ class InstallChecker(object):
         self.ignore_duplicated = set(config.get('installcheck-ignore-duplicated-binaries', '').split(' '))
         self.ignore_conflicts = set(config.get('installcheck-ignore-conflicts', '').split(' '))
         self.ignore_deletes = str2bool(config.get('installcheck-ignore-deletes', 'False'))
+        self.incremental = False
+        self.fileinfo = FileInfoService(api.apiurl, api.project, api.cmain_repo, 'x86_64')
+
+        # install checks are CPU bound, so they run in worker processes if
+        # processes is set
+        self.processes = 0
+        self.executor = None
+        self.mirrored = {}
+        self.mirror_locks = {}
+        self.mirror_lock = threading.Lock()
 
     def check_required_by(self, fileinfo, provides, requiredby, built_binaries, comments):
         if requiredby.get('name') in built_binaries:
@@ -65,17 +81,9 @@ class InstallChecker(object):
         provide = provide.split(' ')[0]
         comments.append('{} provides {} required by {}'.format(
             fileinfo.find('name').text, provide, requiredby.get('name')))
-        url = api.makeurl(['build', api.project, api.cmain_repo, 'x86_64', '_repository', requiredby.get('name') + '.rpm'],
-                          {'view': 'fileinfo_ext'})
-        reverse_fileinfo = ET.parse(osc.core.http_GET(url)).getroot()
-
-        for require in reverse_fileinfo.findall('requires_ext'):
-            # extract >= and the like here too
-            dep = require.get('dep').split(' ')[0]
-            if dep != provide:
-                if provide in require.get('dep'):
-                    possible_dep = require.get('dep')
-                continue
+        requires_by_dep, requires = self.fileinfo.requires(requiredby.get('name'))
+
+        for require in requires_by_dep.get(provide, []):
             dep_found = True
             # Whether this is provided by something being deleted
             provided_found = False
@@ -96,6 +104,9 @@ class InstallChecker(object):
                 result = False
 
         if not dep_found:
+            for require in requires:
+                if provide in require.get('dep'):
+                    possible_dep = require.get('dep')
             comments.append("  OBS doesn't see this dep in reverse though. Not sure what to do.")
             if possible_dep is not None:
                 comments.append(f'  Might be required by {possible_dep}')
@@ -127,16 +138,13 @@ class InstallChecker(object):
 
         built_binaries = set()
         file_infos = []
-        for flavor in pkg_flavors:
-            for fileinfo in fileinfo_ext_all(self.api.apiurl, self.api.project, self.api.cmain_repo, 'x86_64', flavor):
-                built_binaries.add(fileinfo.find('name').text)
-                file_infos.append(fileinfo)
-        # extend the others - this asks for a refactoring, but we don't handle tons of delete requests often
-        for ptd in to_delete:
-            if ptd in pkg_flavors:
-                continue
-            for fileinfo in fileinfo_ext_all(self.api.apiurl, self.api.project, self.api.cmain_repo, 'x86_64', ptd):
+        # the binaries of all packages to be deleted are fetched at once and
+        # cached, so later delete requests of the staging are served from it
+        for ptd, fileinfos in self.fileinfo.packages(sorted(pkg_flavors | to_delete)).items():
+            for fileinfo in fileinfos:
                 built_binaries.add(fileinfo.find('name').text)
+                if ptd in pkg_flavors:
+                    file_infos.append(fileinfo)
 
         result = True
         for fileinfo in file_infos:
@@ -174,6 +182,29 @@ class InstallChecker(object):
         return set(args)
 
     def staging(self, project, force=False):
+        return self.report_staging(project, self.check_staging(project, force))
+
+    def stagings(self, projects, jobs):
+        """
+        Check stagings concurrently, but report them in the given order as
+        soon as all previous ones are reported.
+        """
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(self.check_staging, projects)
+            for project, result in zip(projects, results):
+                self.report_staging(project, result)
+
+    def mirror(self, project, repository, arch):
+        """Mirror a repository only once per run even for concurrent stagings."""
+        key = (project, repository, arch)
+        with self.mirror_lock:
+            lock = self.mirror_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self.mirrored:
+                self.mirrored[key] = mirror(self.api.apiurl, project, repository, arch)
+            return self.mirrored[key]
+
+    def check_staging(self, project, force=False):
         api = self.api
 
         repository = self.api.cmain_repo
@@ -185,7 +216,7 @@ class InstallChecker(object):
         except HTTPError as e:
             if e.code == 404:
                 # adi disappear all the time, so don't worry
-                return False
+                return StagingResult(False, None, None)
             raise e
 
         all_done = True
@@ -194,7 +225,7 @@ class InstallChecker(object):
             buildid = self.buildid(project, repository, arch)
             if not buildid:
                 self.logger.error('No build ID in {}'.format(pra))
-                return False
+                return StagingResult(False, None, None)
             buildids[arch] = buildid
             url = self.report_url(project, repository, arch, buildid)
             try:
@@ -209,7 +240,7 @@ class InstallChecker(object):
                 all_done = False
 
         if all_done and not force:
-            return True
+            return StagingResult(True, None, None)
 
         repository_pairs = repository_path_expand(api.apiurl, project, repository)
         result_comment = []
@@ -219,7 +250,7 @@ class InstallChecker(object):
         status = api.project_status(project)
         if status is None:
             self.logger.error('no project status for {}'.format(project))
-            return False
+            return StagingResult(False, None, None)
 
         # collect packages to be deleted
         to_delete = set()
@@ -231,6 +262,7 @@ class InstallChecker(object):
             if req.get('type') == 'delete':
                 result = self.check_delete_request(req, to_ignore, to_delete, result_comment) and result
 
+        install_checks = []
         for arch in architectures:
             # hit the first repository in the target project (if existant)
             target_pair = None
@@ -241,13 +273,13 @@ class InstallChecker(object):
                     if not target_pair and pair_project == api.project:
                         target_pair = [pair_project, pair_repository]
 
-                    directories.append(mirror(self.api.apiurl, pair_project, pair_repository, arch))
+                    directories.append(self.mirror(pair_project, pair_repository, arch))
 
             if not api.is_adi_project(project):
                 # For "leaky" ring packages in letter stagings, where the
                 # repository setup does not include the target project, that are
                 # not intended to to have all run-time dependencies satisfied.
-                whitelist = self.ring_whitelist
+                whitelist = set(self.ring_whitelist)
             else:
                 whitelist = set()
 
@@ -260,7 +292,13 @@ class InstallChecker(object):
                 result_comment.append(check.comment)
                 result = False
 
-            check = self.install_check(directories, arch, whitelist, ignore_conflicts)
+            state_file = None
+            if self.incremental:
+                state_file = installcheck_state_file(api.apiurl, project, repository, arch, directories)
+            install_checks.append(self.install_check_submit(directories, arch, whitelist, ignore_conflicts, state_file))
+
+        for install_check in install_checks:
+            check = install_check()
             if not check.success:
                 self.logger.warning('Install check failed')
                 result_comment.append(check.comment)
@@ -279,15 +317,21 @@ class InstallChecker(object):
             result_comment.append(yaml.dump(duplicates, default_flow_style=False))
             result = False
 
-        if result:
-            self.report_state('success', self.gocd_url(), project, repository, buildids)
-        else:
-            result_comment.insert(0, 'Generated from {}\n'.format(self.gocd_url()))
-            self.report_state('failure', self.upload_failure(project, result_comment), project, repository, buildids)
-            self.logger.warning('Not accepting {}'.format(project))
-            return False
+        return StagingResult(result, result_comment, buildids)
 
-        return result
+    def report_staging(self, project, result):
+        if result.buildids is None:
+            return result.success
+
+        repository = self.api.cmain_repo
+        if result.success:
+            self.report_state('success', self.gocd_url(), project, repository, result.buildids)
+            return True
+
+        comment = ['Generated from {}\n'.format(self.gocd_url())] + result.comment
+        self.report_state('failure', self.upload_failure(project, comment), project, repository, result.buildids)
+        self.logger.warning('Not accepting {}'.format(project))
+        return False
 
     def upload_failure(self, project, comment):
         print(project, '\n'.join(comment))
@@ -356,9 +400,27 @@ class InstallChecker(object):
         # Trick to prioritize x86_64.
         return sorted(archs, reverse=True)
 
-    def install_check(self, directories, arch, whitelist, ignored_conflicts):
+    def install_check(self, directories, arch, whitelist, ignored_conflicts, state_file=None):
+        return self.install_check_submit(directories, arch, whitelist, ignored_conflicts, state_file)()
+
+    def install_check_submit(self, directories, arch, whitelist, ignored_conflicts, state_file=None):
+        """
+        Start an install check, in a worker process if enabled, and return a
+        callable returning its CheckResult.
+        """
         self.logger.info('install check: start (whitelist:{})'.format(','.join(whitelist)))
-        parts = installcheck(directories, arch, whitelist, ignored_conflicts)
+        if not self.processes:
+            parts = installcheck(directories, arch, whitelist, ignored_conflicts, state_file)
+            return lambda: self.install_check_result(arch, parts)
+
+        if self.executor is None:
+            # the checking threads must not be forked
+            self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        future = self.executor.submit(installcheck, directories, arch, whitelist, ignored_conflicts, state_file)
+        return lambda: self.install_check_result(arch, future.result())
+
+    def install_check_result(self, arch, parts):
         if len(parts):
             header = '### [install check & file conflicts for {}]'.format(arch)
             return CheckResult(False, header + '\n\n' + ('\n' + ('-' * 80) + '\n\n').join(parts))
@@ -376,18 +438,16 @@ class InstallChecker(object):
         self.logger.info('cycle check: start %s/%s/%s' % (project, repository, arch))
         comment = []
 
-        depinfo = builddepinfo(self.api.apiurl, project, repository, arch, order=False)
-        for cycle in depinfo.findall('cycle'):
-            for package in cycle.findall('package'):
-                package = package.text
+        graph = builddepgraph(self.api.apiurl, project, repository, arch)
+        for cycle in graph.cycles():
+            for package in cycle:
                 allowed = False
                 for acycle in self.allowed_cycles:
                     if package in acycle:
                         allowed = True
                         break
                 if not allowed:
-                    cycled = [p.text for p in cycle.findall('package')]
-                    comment.append('Package {} appears in cycle {}'.format(package, '/'.join(cycled)))
+                    comment.append('Package {} appears in cycle {}'.format(package, '/'.join(cycle)))
 
         if len(comment):
             # New cycles, post comment.
@@ -408,6 +468,12 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--debug', action='store_true', default=False,
                         help='enable debug information')
     parser.add_argument('-A', '--apiurl', metavar='URL', help='API URL')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='only recheck packages affected by changed binaries')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of stagings to check concurrently')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='number of worker processes for the install checks (0 to check in-process)')
 
     args = parser.parse_args()
 
@@ -418,6 +484,8 @@ if __name__ == '__main__':
     config = Config.get(apiurl, args.project)
     api = StagingAPI(apiurl, args.project)
     staging_report = InstallChecker(api, config)
+    staging_report.incremental = args.incremental
+    staging_report.processes = args.processes
 
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -428,7 +496,6 @@ if __name__ == '__main__':
         if not staging_report.staging(api.prj_from_short(args.staging), force=True):
             sys.exit(1)
     else:
-        for staging in api.get_staging_projects():
-            if api.is_adi_project(staging):
-                staging_report.staging(staging)
+        stagings = [staging for staging in api.get_staging_projects() if api.is_adi_project(staging)]
+        staging_report.stagings(stagings, args.jobs)
     sys.exit(0)
@@ -1,7 +1,12 @@
 import logging
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
 from . import OBSLocal
 from osclib.comments import CommentAPI
-from ReviewBot import ReviewBot
+from ReviewBot import ReviewBot, VerdictCache
 import random
 
 COMMENT = 'short comment'
@@ -163,3 +168,85 @@ class TestReviewBotComment(OBSLocal.TestCase):
     def comments_filtered(self, bot):
         comments = self.api.get_comments(project_name=PROJECT)
         return self.api.comment_find(comments, bot)
+
+
+class TestVerdictCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'verdicts.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        cache = VerdictCache(self.filename, 60)
+        self.assertIsNone(cache.get('1', 'a'))
+
+        cache.put('1', 'a', True, {'accepted': 'ok'})
+        entry = cache.get('1', 'a')
+        self.assertEqual(entry['verdict'], True)
+        self.assertEqual(entry['review_messages'], {'accepted': 'ok'})
+        # the request changed since
+        self.assertIsNone(cache.get('1', 'b'))
+
+        cache.save()
+        entry = VerdictCache(self.filename, 60).get('1', 'a')
+        self.assertEqual(entry['verdict'], True)
+
+    def test_expiry(self):
+        cache = VerdictCache(self.filename, 60)
+        cache.put('1', 'a', False, {})
+        cache.put('2', 'a', None, {})
+        cache.entries['1']['time'] -= 61
+        self.assertIsNone(cache.get('1', 'a'))
+        self.assertIsNotNone(cache.get('2', 'a'))
+
+        # expired entries are not persisted
+        cache.save()
+        self.assertEqual(list(VerdictCache(self.filename, 60).entries), ['2'])
+
+
+class TestRequestFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.bot = ReviewBot('https://api.example.org', logger=logging.getLogger(__name__))
+        self.srcmd5 = {'devel': 'aaa', 'openSUSE:Factory': 'bbb'}
+        self.bot.get_sourceinfo = lambda project, package: SimpleNamespace(srcmd5=self.srcmd5[project])
+        self.comments = {}
+        self.bot.comment_api.get_comments = lambda request_id: dict(self.comments)
+
+        self.review = SimpleNamespace(by_user='reviewer', by_group=None, by_project=None, by_package=None, state='new')
+        action = SimpleNamespace(type='submit', src_project='devel', src_package='foo', src_rev=None,
+                                 tgt_project='openSUSE:Factory', tgt_package='foo')
+        self.request = SimpleNamespace(reqid='1', state=SimpleNamespace(name='review'), reviews=[self.review],
+                                       actions=[action], description='update')
+
+    def comment(self, id, text):
+        self.comments[id] = {'id': id, 'who': 'someone', 'when': None, 'parent': None, 'comment': text}
+
+    def assertChanges(self, change):
+        before = self.bot.request_fingerprint(self.request)
+        self.assertEqual(before, self.bot.request_fingerprint(self.request))
+        change()
+        self.assertNotEqual(before, self.bot.request_fingerprint(self.request))
+
+    def test_srcmd5(self):
+        self.assertChanges(lambda: self.srcmd5.update({'devel': 'ccc'}))
+        self.assertChanges(lambda: self.srcmd5.update({'openSUSE:Factory': 'ddd'}))
+
+    def test_review(self):
+        self.assertChanges(lambda: setattr(self.review, 'state', 'accepted'))
+
+    def test_comment(self):
+        self.assertChanges(lambda: self.comment('10', '@reviewer override accept'))
+        self.assertChanges(lambda: setattr(self.request, 'description', '@reviewer override decline'))
+
+        # comments of bots do not matter
+        before = self.bot.request_fingerprint(self.request)
+        self.comment('11', '<!-- SomeBot state=done -->\nall good')
+        self.assertEqual(before, self.bot.request_fingerprint(self.request))
+
+        # nor any comment if overrides are not allowed
+        self.bot.override_allow = False
+        before = self.bot.request_fingerprint(self.request)
+        self.comment('12', '@reviewer override accept')
+        self.assertEqual(before, self.bot.request_fingerprint(self.request))
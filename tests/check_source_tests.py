@@ -1,9 +1,15 @@
+import json
 import logging
 from . import OBSLocal
 from check_source import CheckSource
 import os
 from osc.core import get_request_list
 import pytest
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+import unittest
 
 PROJECT = 'Testing:Project'
 SRC_PROJECT = 'devel:Fishing'
@@ -426,3 +432,68 @@ class TestCheckSource(OBSLocal.TestCase):
         fixtures_path = os.path.join(FIXTURES, 'packages', target_files)
         self.target_package = OBSLocal.Package('blowfish', self.wf.projects[PROJECT], devel_project=SRC_PROJECT)
         self.target_package.commit_files(fixtures_path)
+
+
+class TestRunValidators(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bot = CheckSource('https://api.example.org', logger=logging.getLogger(__name__))
+        self.bot.request = SimpleNamespace(reqid='1')
+        self.bot.review_messages = {'accepted': 'ok', 'declined': 'review failed'}
+        self.bot.validator_stats = os.path.join(self.directory, 'stats.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def validator(self, name, result):
+        def validate():
+            if not result:
+                self.bot.review_messages['declined'] = name
+            return result
+        return (name, validate, ())
+
+    def stats(self):
+        with open(self.bot.validator_stats) as f:
+            return [json.loads(line) for line in f]
+
+    def test_passed(self):
+        failed = self.bot.run_validators('foo', [self.validator('a', True), self.validator('b', True)])
+        self.assertIsNone(failed)
+        self.assertEqual(self.bot.review_messages['declined'], 'review failed')
+        stats = sorted(self.stats(), key=lambda entry: entry['validator'])
+        self.assertEqual([(entry['request'], entry['package'], entry['validator'], entry['passed'])
+                          for entry in stats], [('1', 'foo', 'a', True), ('1', 'foo', 'b', True)])
+
+    def test_short_circuit(self):
+        returncodes = []
+
+        def slow():
+            returncodes.append(self.bot.validator_run(['sleep', '60']).returncode)
+            return True
+
+        def fast():
+            # give the slow validator time to start its subprocess
+            time.sleep(1)
+            self.bot.review_messages['declined'] = 'fast'
+            return False
+
+        start = time.time()
+        failed = self.bot.run_validators('foo', [('slow', slow, ()), ('fast', fast, ())])
+        self.assertEqual(failed, 'fast')
+        self.assertEqual(self.bot.review_messages['declined'], 'fast')
+        # the cancelled validator is not waited for and does not show up in the stats
+        self.assertEqual([(entry['validator'], entry['passed']) for entry in self.stats()], [('fast', False)])
+
+        # its subprocess is terminated
+        while not returncodes and time.time() - start < 30:
+            time.sleep(0.1)
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(returncodes, [-15])
+
+    def test_order(self):
+        validators = [self.validator('a', False), self.validator('b', False), self.validator('c', True)]
+        # the first failure in the given order is reported
+        self.assertEqual(self.bot.run_validators('foo', validators, concurrent=False), 'a')
+        self.assertEqual(self.bot.review_messages['declined'], 'a')
+        # validators after it did not run
+        self.assertEqual([entry['validator'] for entry in self.stats()], ['a'])
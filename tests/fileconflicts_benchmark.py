@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+
+# Offline benchmark of the native file conflict check against findfileconflicts.
+#
+# Generates a susetags packages fixture of a large base repository and a
+# small staging repository shadowing part of it, with file, directory, mode,
+# ghost, usrmerge and implicit directory conflicts as well as conflicts that
+# are ruled out by Conflicts, Obsoletes or multiarch. Both implementations are
+# run on it, the conflicts involving the staging packages are compared and
+# wall times are written as JSON.
+#
+# Run from the top of the checkout:
+#
+#   python3 -m tests.fileconflicts_benchmark --output bench.json
+#   python3 -m tests.fileconflicts_benchmark --baseline bench.json
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from osclib.fileconflicts import FileConflicts, FileIndex, parse_packages
+
+SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'findfileconflicts')
+
+FILE = '100644 0 root:root'
+EXECUTABLE = '100755 0 root:root'
+DIRECTORY = '40755 0 root:root'
+SYMLINK = '120777 0 root:root'
+GHOST = '100000 100 root:root'
+
+
+def package_name(index):
+    return 'bench-{:05d}'.format(index)
+
+
+def snippet(name, version, files, provides=(), conflicts=(), obsoletes=(), arch='x86_64'):
+    lines = ['=Pkg: {} {} 1.1 {}'.format(name, version, arch),
+             '=Src: {} {} 1.1 src'.format(name, version),
+             '+Flx:']
+    lines += ['{} {}'.format(mode, path) for mode, path in files]
+    lines += ['-Flx:', '+Prv:', '{} = {}-1.1'.format(name, version)]
+    lines += list(provides)
+    lines += ['-Prv:', '+Con:'] + list(conflicts) + ['-Con:', '+Obs:'] + list(obsoletes) + ['-Obs:']
+    return '\n'.join(lines) + '\n'
+
+
+def base_files(name, rng):
+    files = [(DIRECTORY, '/usr/share/{}'.format(name)),
+             (EXECUTABLE, '/usr/bin/{}'.format(name)),
+             (FILE, '/usr/share/doc/packages/{}/README'.format(name))]
+    for index in range(rng.randint(10, 40)):
+        files.append((FILE, '/usr/share/{}/data/file-{}'.format(name, index)))
+    return files
+
+
+def generate_base(names, rng):
+    packages = [snippet('filesystem', '1', [
+        (SYMLINK, '/bin -> usr/bin'), (SYMLINK, '/sbin -> usr/sbin'),
+        (SYMLINK, '/lib -> usr/lib'), (SYMLINK, '/lib64 -> usr/lib64'),
+        (DIRECTORY, '/usr/bin'), (DIRECTORY, '/usr/share'), (DIRECTORY, '/usr/share/doc/packages')])]
+    for index, name in enumerate(names):
+        files = base_files(name, rng)
+        if index % 50 == 0:
+            files.append((FILE, '/usr/share/common/file-{}'.format(index % 20)))
+        packages.append(snippet(name, '1', files))
+    return packages
+
+
+def generate_staging(names, staged, rng):
+    packages = []
+    for index in range(staged):
+        base = rng.choice(names)
+        kind = index % 8
+        if kind == 0:
+            # update of a base package
+            packages.append(snippet(base, '2', base_files(base, rng)))
+            continue
+
+        name = 'staged-{:04d}'.format(index)
+        files = [(FILE, '/usr/share/{}/file'.format(name))]
+        conflicts = []
+        obsoletes = []
+        if kind == 1:
+            files.append((FILE, '/usr/share/{}/data/file-0'.format(base)))
+        elif kind == 2:
+            files.append((SYMLINK, '/usr/bin/{} -> /usr/bin/true'.format(base)))
+        elif kind == 3:
+            files.append((GHOST, '/usr/share/{}/data/file-1'.format(base)))
+        elif kind == 4:
+            # a file where the base package has a directory
+            files.append((FILE, '/usr/share/{}'.format(base)))
+        elif kind == 5:
+            # same file via the usrmerge compat directory
+            files.append((EXECUTABLE, '/bin/{}'.format(base)))
+        elif kind == 6:
+            files.append((FILE, '/usr/share/{}/data/file-2'.format(base)))
+            conflicts.append(base)
+        else:
+            files.append((FILE, '/usr/share/{}/data/file-3'.format(base)))
+            obsoletes.append(base)
+            name = base
+        packages.append(snippet(name, '2', files, conflicts=conflicts, obsoletes=obsoletes))
+    return packages
+
+
+def generate(directory, solvables, staged, seed):
+    rng = random.Random(seed)
+    names = [package_name(index) for index in range(solvables)]
+    base = generate_base(names, rng)
+    staging = generate_staging(names, staged, rng)
+
+    paths = {}
+    for name, packages in (('staging', staging), ('base', base)):
+        paths[name] = os.path.join(directory, name)
+        with open(paths[name], 'w') as fh:
+            fh.write('=Ver: 2.0\n' + ''.join(packages))
+
+    # findfileconflicts gets the combined file with shadowed packages removed
+    # as write_repo_susetags_file.pl would write it
+    staged_names = set(package.split('\n', 1)[0].split(' ')[1] for package in staging)
+    combined = staging + [package for package in base if package.split('\n', 1)[0].split(' ')[1] not in staged_names]
+    paths['combined'] = os.path.join(directory, 'packages')
+    with open(paths['combined'], 'w') as fh:
+        fh.write('=Ver: 2.0\n' + ''.join(combined))
+    return paths, staged_names
+
+
+def normalize(conflicts, targets):
+    result = set()
+    for conflict in conflicts or []:
+        sp1, sp2 = conflict['between']
+        if sp1[0] not in targets and sp2[0] not in targets:
+            continue
+        for path in conflict['conflicts'].split('\n'):
+            result.add((' '.join(map(str, sp1)), ' '.join(map(str, sp2)), path.split(' [', 1)[0]))
+    return result
+
+
+def timed(phases, name, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+    phases[name] = {
+        'seconds': round(duration, 4),
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    logging.info('%s took %f', name, duration)
+    return result
+
+
+def run_perl(filename):
+    p = subprocess.run(['perl', SCRIPT, filename], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return yaml.safe_load(p.stdout)
+
+
+def build_indexes(directory, paths):
+    indexes = []
+    for name in ('staging', 'base'):
+        filename = os.path.join(directory, name + '.idx')
+        with open(paths[name]) as fh:
+            FileIndex.write(filename, parse_packages(fh))
+        indexes.append(filename)
+    return indexes
+
+
+def run_native(filenames, targets):
+    return FileConflicts([FileIndex(filename) for filename in filenames]).conflicts(targets)
+
+
+def benchmark(directory, solvables, staged, seed):
+    paths, targets = generate(directory, solvables, staged, seed)
+
+    phases = {}
+    perl = timed(phases, 'findfileconflicts', run_perl, paths['combined'])
+    indexes = timed(phases, 'index_build', build_indexes, directory, paths)
+    native = timed(phases, 'native_check', run_native, indexes, targets)
+
+    perl = normalize(perl, targets)
+    native = normalize(native, targets)
+    return {
+        'parameters': {
+            'solvables': solvables,
+            'staged': staged,
+            'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'phases': phases,
+        'conflicts': len(native),
+        'only_findfileconflicts': sorted(perl - native),
+        'only_native': sorted(native - perl),
+    }
+
+
+def compare(baseline, result, tolerance):
+    regressions = []
+    for phase, current in result['phases'].items():
+        previous = baseline['phases'].get(phase)
+        if not previous:
+            continue
+        if current['seconds'] > previous['seconds'] * tolerance:
+            regressions.append('{}: {:.3f}s -> {:.3f}s'.format(phase, previous['seconds'], current['seconds']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the native file conflict check against findfileconflicts')
+    parser.add_argument('--solvables', type=int, default=30000, help='number of packages in the base repository')
+    parser.add_argument('--staged', type=int, default=200, help='number of packages in the staging repository')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the fixture generator')
+    parser.add_argument('--output', default='fileconflicts-benchmark.json', help='JSON file to store the results in')
+    parser.add_argument('--baseline', help='previous JSON result to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='allowed slowdown factor per phase before a regression is reported')
+    parser.add_argument('--keep', action='store_true', help='keep the generated fixtures')
+    parser.add_argument('-d', '--debug', action='store_true', help='enable debug information')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    directory = tempfile.mkdtemp(prefix='fileconflicts-benchmark-')
+    try:
+        result = benchmark(directory, args.solvables, args.staged, args.seed)
+    finally:
+        if args.keep:
+            logging.info('fixtures kept in %s', directory)
+        else:
+            shutil.rmtree(directory)
+
+    with open(args.output, 'w') as fh:
+        json.dump(result, fh, indent=2, sort_keys=True)
+
+    failed = False
+    for side in ('only_findfileconflicts', 'only_native'):
+        for conflict in result[side]:
+            logging.error('%s: %s', side, conflict)
+            failed = True
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(json.load(fh), result, args.tolerance)
+        for regression in regressions:
+            logging.error('regression in %s', regression)
+            failed = True
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from osclib.fileconflicts import FileConflicts, FileIndex, parse_packages
+
+FILESYSTEM_USRMERGE = {
+    'name': 'filesystem',
+    'files': ['120777 0 root:root /bin -> usr/bin', '40755 0 root:root /usr/bin'],
+}
+
+
+def susetags(packages):
+    """Packages file as written by write_repo_susetags_file.pl."""
+    lines = []
+    for package in packages:
+        lines.append('=Pkg: {} 1.0 1 {}'.format(package['name'], package.get('arch', 'x86_64')))
+        lines.append('=Src: {} 1.0 1 src'.format(package.get('source', package['name'])))
+        for section, entries in (('Prv', package.get('provides', [package['name']])),
+                                 ('Con', package.get('conflicts', [])),
+                                 ('Obs', package.get('obsoletes', [])),
+                                 ('Flx', package.get('files', []))):
+            lines.append('+{}:'.format(section))
+            lines.extend(entries)
+            lines.append('-{}:'.format(section))
+    return [line + '\n' for line in lines]
+
+
+class TestFileConflicts(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def index(self, packages):
+        filename = os.path.join(self.directory, '{}.idx'.format(len(os.listdir(self.directory))))
+        FileIndex.write(filename, parse_packages(susetags(packages)))
+        return FileIndex(filename)
+
+    def conflicts(self, *repositories, target_packages=None):
+        indexes = [self.index(packages) for packages in repositories]
+        return [(conflict['between'][0][0], conflict['between'][1][0], conflict['conflicts'].split('\n'))
+                for conflict in FileConflicts(indexes).conflicts(target_packages)]
+
+    def test_conflict(self):
+        packages = [
+            {'name': 'a', 'files': ['100644 0 root:root /usr/bin/tool']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/tool', '100644 0 root:root /usr/bin/b']},
+        ]
+        self.assertEqual(self.conflicts(packages), [('a', 'b', ['/usr/bin/tool'])])
+
+    def test_target_packages(self):
+        target = [{'name': 'a', 'files': ['100644 0 root:root /usr/bin/tool']}]
+        other = [
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/tool']},
+            {'name': 'c', 'files': ['100644 0 root:root /usr/bin/other']},
+            {'name': 'd', 'files': ['100644 0 root:root /usr/bin/other']},
+        ]
+        self.assertEqual(self.conflicts(target, other), [('a', 'b', ['/usr/bin/tool'])])
+        self.assertEqual(self.conflicts(target, other, target_packages={'c': 'c'}), [])
+
+    def test_shadowed(self):
+        target = [{'name': 'a', 'files': ['100644 0 root:root /usr/bin/tool']}]
+        # the package of the same name in the first repository replaces it
+        other = [
+            {'name': 'a', 'files': ['100644 0 root:root /usr/bin/old']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/old']},
+        ]
+        self.assertEqual(self.conflicts(target, other), [])
+
+    def test_usrmerge(self):
+        packages = [
+            {'name': 'a', 'files': ['100644 0 root:root /bin/tool']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/tool']},
+        ]
+        self.assertEqual(self.conflicts(packages), [])
+        self.assertEqual(self.conflicts(packages + [FILESYSTEM_USRMERGE]), [('a', 'b', ['/usr/bin/tool'])])
+
+    def test_ghost(self):
+        packages = [
+            {'name': 'a', 'files': ['100000 100 root:root /var/log/tool.log', '40755 100 root:root /run/tool']},
+            {'name': 'b', 'files': ['100000 100 root:root /var/log/tool.log', '40755 0 root:root /run/tool']},
+        ]
+        # identical ghost files and ghost directories do not conflict
+        self.assertEqual(self.conflicts(packages), [])
+
+        packages[1]['files'] = ['100644 0 root:root /var/log/tool.log']
+        conflicts = self.conflicts(packages)
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0][:2], ('a', 'b'))
+        self.assertEqual(conflicts[0][2], ['/var/log/tool.log [mode mismatch: g -644 root:root, -644 root:root]'])
+
+    def test_implicit_directory(self):
+        packages = [
+            {'name': 'a', 'files': ['100644 0 root:root /usr/share/tool']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/share/tool/data']},
+        ]
+        self.assertEqual(self.conflicts(packages),
+                         [('a', 'b', ['/usr/share/tool [mode mismatch: -644 root:root, d755 root:root]'])])
+
+        # directories with the same mode do not conflict
+        packages[0]['files'] = ['40755 0 root:root /usr/share/tool']
+        self.assertEqual(self.conflicts(packages), [])
+
+    def test_conflicts(self):
+        packages = [
+            {'name': 'a', 'files': ['100644 0 root:root /usr/bin/tool'], 'conflicts': ['b']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/tool']},
+        ]
+        self.assertEqual(self.conflicts(packages), [])
+
+        packages[0]['conflicts'] = ['otherproviders(tool)']
+        packages[1]['provides'] = ['b', 'tool']
+        self.assertEqual(self.conflicts(packages), [])
+
+    def test_obsoletes(self):
+        packages = [
+            {'name': 'a', 'files': ['100644 0 root:root /usr/bin/tool'], 'obsoletes': ['b']},
+            {'name': 'b', 'files': ['100644 0 root:root /usr/bin/tool']},
+        ]
+        self.assertEqual(self.conflicts(packages), [])
+
+        # obsoleting a package that does not provide its name does not help
+        packages[1]['provides'] = []
+        self.assertEqual(self.conflicts(packages), [('a', 'b', ['/usr/bin/tool'])])
+
+    def test_32bit(self):
+        packages = [
+            {'name': 'libtool-32bit', 'files': ['100644 0 root:root /usr/lib/libtool.so.1']},
+            {'name': 'libtool', 'arch': 'i586', 'files': ['100644 0 root:root /usr/lib/libtool.so.1']},
+        ]
+        self.assertEqual(self.conflicts(packages), [])
+
+        packages[1]['arch'] = 'x86_64'
+        self.assertEqual(self.conflicts(packages), [('libtool', 'libtool-32bit', ['/usr/lib/libtool.so.1'])])
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from osclib.repochecks import InstallcheckEngine
+
+PRIMARY = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="{}">
+{}</metadata>
+'''
+
+PACKAGE = '''<package type="rpm">
+  <name>{name}</name>
+  <arch>{arch}</arch>
+  <version epoch="0" ver="{version}" rel="{release}"/>
+  <format>
+    <rpm:sourcerpm>{source}-{version}-{release}.src.rpm</rpm:sourcerpm>
+    <rpm:provides>{provides}</rpm:provides>
+    <rpm:requires>{requires}</rpm:requires>
+  </format>
+</package>
+'''
+
+
+def primary(packages):
+    """primary.xml of the packages as mirrored from a download repository."""
+    content = ''
+    for package in packages:
+        provides = [package['name']] + package.get('provides', [])
+        content += PACKAGE.format(
+            name=package['name'], arch=package.get('arch', 'x86_64'), source=package.get('source', package['name']),
+            version=package.get('version', '1.0'), release=package.get('release', '1.1'),
+            provides=''.join('<rpm:entry name="{}"/>'.format(name) for name in provides),
+            requires=''.join('<rpm:entry name="{}"/>'.format(name) for name in package.get('requires', [])))
+    return PRIMARY.format(len(packages), content)
+
+
+class TestInstallcheck(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = InstallcheckEngine()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, *repositories, **kwargs):
+        paths = []
+        for packages in repositories:
+            path = os.path.join(self.directory, '{}-primary.xml'.format(len(os.listdir(self.directory))))
+            with open(path, 'w') as f:
+                f.write(primary(packages))
+            paths.append(path)
+        return self.engine.check(paths, 'x86_64', **kwargs)
+
+    def test_installable(self):
+        self.assertEqual(self.check([
+            {'name': 'app', 'requires': ['libfoo.so.1']},
+            {'name': 'libfoo1', 'provides': ['libfoo.so.1']},
+        ]), {})
+
+    def test_missing_provider(self):
+        problems = self.check([
+            {'name': 'app', 'source': 'app-src', 'requires': ['libfoo.so.1']},
+            {'name': 'other'},
+        ])
+        # the format of the old installcheck output: can't install app-1.0-1.1.x86_64:
+        self.assertEqual(problems, {'app': {
+            'problem': 'app-1.0-1.1.x86_64',
+            'output': ['nothing provides libfoo.so.1 needed by app-1.0.x86_64'],
+            'source': 'app-src',
+        }})
+
+    def test_nested(self):
+        problems = self.check([
+            {'name': 'app', 'requires': ['libfoo1']},
+            {'name': 'libfoo1', 'requires': ['libbar.so.1']},
+        ])
+        self.assertEqual(sorted(problems), ['app', 'libfoo1'])
+        self.assertEqual(problems['libfoo1']['output'], ['nothing provides libbar.so.1 needed by libfoo1-1.0.x86_64'])
+        # the complete problem of libfoo1 is part of the problem of app, so it
+        # is replaced by a FOLLOWUP in project-installcheck
+        self.assertEqual(problems['app']['output'], [
+            'package app-1.0.x86_64 requires libfoo1, but none of the providers can be installed',
+            'nothing provides libbar.so.1 needed by libfoo1-1.0.x86_64',
+        ])
+
+    def test_path(self):
+        target = [{'name': 'app', 'requires': ['libfoo.so.1']}]
+        base = [{'name': 'libfoo1', 'provides': ['libfoo.so.1']}, {'name': 'broken', 'requires': ['missing']}]
+        # only packages of the first repository are checked
+        self.assertEqual(self.check(target, base), {})
+
+    def test_shadowed(self):
+        target = [{'name': 'libfoo1', 'version': '2.0'}, {'name': 'app', 'requires': ['libfoo.so.1']}]
+        # the package of the same name in the first repository replaces it
+        base = [{'name': 'libfoo1', 'provides': ['libfoo.so.1']}]
+        problems = self.check(target, base)
+        self.assertEqual(sorted(problems), ['app'])
+        self.assertEqual(problems['app']['output'], ['nothing provides libfoo.so.1 needed by app-1.0.x86_64'])
+
+    def test_target_packages(self):
+        packages = [
+            {'name': 'app', 'requires': ['missing']},
+            {'name': 'tool', 'requires': ['missing']},
+        ]
+        problems = self.check(packages, target_packages={'tool': 'tool-source'})
+        self.assertEqual(sorted(problems), ['tool'])
+        self.assertEqual(problems['tool']['source'], 'tool-source')
+
+    def test_whitelist(self):
+        packages = [
+            {'name': 'app', 'requires': ['missing']},
+            {'name': 'tool', 'requires': ['missing']},
+        ]
+        self.assertEqual(sorted(self.check(packages, whitelist=['app'])), ['tool'])
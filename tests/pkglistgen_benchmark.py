@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+
+# Offline benchmark for the pkglistgen solver.
+#
+# Generates synthetic repo-*.solv files and a package-groups YAML of realistic
+# size, then runs load_all_groups -> solve_module -> _collect_unsorted_packages
+# without talking to OBS. Wall time and peak memory are recorded per phase and
+# written as JSON so that changes to the solver code can be compared against a
+# previous run.
+#
+# Run from the top of the checkout:
+#
+#   python3 -m tests.pkglistgen_benchmark --output bench.json
+#   python3 -m tests.pkglistgen_benchmark --baseline bench.json
+
+import argparse
+import importlib.metadata
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import solv
+import yaml
+
+from pkglistgen import tool
+from pkglistgen.tool import PkgListGen
+
+PROJECTS = [('openSUSE:Factory', 'standard'), ('openSUSE:Factory:Update', 'standard')]
+ARCHITECTURES = ['x86_64', 'aarch64']
+STATE = 'benchmark'
+
+
+class BenchmarkPkgListGen(PkgListGen):
+    """PkgListGen that never touches OBS."""
+
+    def __init__(self):
+        self.apiurl = None
+        self.debug = False
+        self.caching = False
+        self.dryrun = False
+        self.logger = logging.getLogger(__name__)
+        self.reset()
+
+
+def repository_arch_state(apiurl, project, repository, arch):
+    return STATE
+
+
+def package_name(index):
+    return 'bench-{:05d}'.format(index)
+
+
+def base_size(total):
+    return max(total // 20, 1)
+
+
+def generate_solv(path, arch, names, rng, update=False):
+    pool = solv.Pool()
+    pool.setarch(arch)
+    repo = pool.add_repo(os.path.basename(path))
+    data = repo.add_repodata()
+    total = len(names)
+
+    for index, name in enumerate(names):
+        s = repo.add_solvable()
+        s.name = name
+        s.evr = '1.{}-{}'.format(int(update), index % 7 + 1)
+        s.arch = 'noarch' if index % 5 == 0 else arch
+        s.add_deparray(solv.SOLVABLE_PROVIDES, pool.rel2id(s.nameid, s.evrid, solv.REL_EQ))
+        if index % 11 == 0:
+            s.add_deparray(solv.SOLVABLE_PROVIDES, pool.str2id('bench-cap({})'.format(index % 97)))
+
+        # Mostly depend on the base layer at the bottom of the stack, else on
+        # nearby packages and with the odd backward edge so that the solver
+        # also has to deal with cycles. Like in a distribution the closure of
+        # a package stays a fraction of the whole.
+        if index:
+            for _ in range(rng.randint(0, 5)):
+                choice = rng.random()
+                if choice < 0.7 or index <= base_size(total):
+                    target = rng.randrange(min(index, base_size(total)))
+                elif choice < 0.95:
+                    target = rng.randrange(max(index - 50, 0), index)
+                else:
+                    target = rng.randrange(total)
+                # nothing requires devel packages, they can be unwanted
+                if names[target].endswith('-devel'):
+                    continue
+                s.add_deparray(solv.SOLVABLE_REQUIRES, pool.str2id(names[target]))
+        if index % 13 == 0 and index > 97:
+            s.add_deparray(solv.SOLVABLE_REQUIRES, pool.str2id('bench-cap({})'.format(rng.randrange(97))))
+        if index % 17 == 0:
+            s.add_deparray(solv.SOLVABLE_RECOMMENDS, pool.str2id(names[rng.randrange(total)]))
+        if index % 19 == 0:
+            s.add_deparray(solv.SOLVABLE_SUGGESTS, pool.str2id(names[rng.randrange(total)]))
+        if index % 101 == 0 and index > 10:
+            target = rng.randrange(index // 10) * 10 + 9
+            s.add_deparray(solv.SOLVABLE_CONFLICTS, pool.str2id(names[target]))
+
+        source = name[:-len('-devel')] if name.endswith('-devel') else name
+        data.set_sourcepkg(s.id, '{}-1.0-1.src.rpm'.format(source))
+
+    data.internalize()
+    repo.internalize()
+    f = solv.xfopen(path, 'w')
+    repo.write(f)
+    f.close()
+
+
+def generate_repositories(directory, solvables, rng):
+    names = []
+    for index in range(solvables):
+        name = package_name(index)
+        # roughly every tenth package has a devel subpackage
+        if index % 10 == 9:
+            name = package_name(index - 1) + '-devel'
+        names.append(name)
+
+    # the update repository shadows a slice of the main one
+    updates = names[::20]
+    for arch in ARCHITECTURES:
+        for (project, repo), content in zip(PROJECTS, (updates, names)):
+            fn = 'repo-{}-{}-{}-{}.solv'.format(project, repo, arch, STATE)
+            generate_solv(os.path.join(directory, fn), arch, content, rng, update=content is updates)
+
+    return names
+
+
+def generate_groups(directory, names, groups, rng):
+    output = []
+    content = {}
+    devel = [name for name in names if name.endswith('-devel')]
+    unwanted = rng.sample(devel, min(20, len(devel)))
+    # unwanted packages are locked, listing them would make the groups
+    # including the group report them as missing
+    selectable = [name for name in names[base_size(len(names)):] if name not in unwanted]
+    # groups included by a group, directly or via its includes, and the
+    # groups whose packages are removed from it by excludes
+    inherited = []
+    removed = []
+    for index in range(groups):
+        groupname = 'bench_group_{:02d}'.format(index)
+        packages = []
+        # the base layer is pulled in by everything anyway
+        for name in rng.sample(selectable, 40):
+            if rng.random() < 0.05:
+                packages.append({name: [rng.choice(ARCHITECTURES)]})
+            elif rng.random() < 0.03:
+                packages.append({name: ['recommended']})
+            else:
+                packages.append(name)
+        content[groupname] = packages
+
+        settings = {}
+        inherited.append(set())
+        removed.append(set())
+        if index:
+            include = rng.randrange(index)
+            inherited[index] = inherited[include] | {include}
+            settings['includes'] = ['bench_group_{:02d}'.format(include)]
+            # excluding a group sharing packages with the included ones
+            # would report them as missing instead of solving a realistic
+            # module
+            candidates = [group for group in range(index)
+                          if not (inherited[group] | removed[group] | {group}) & inherited[index]]
+            if candidates:
+                exclude = rng.choice(candidates)
+                removed[index] = inherited[exclude] | removed[exclude] | {exclude}
+                settings['excludes'] = ['bench_group_{:02d}'.format(exclude)]
+        if index % 6 == 0:
+            settings['recommends'] = False
+        output.append({groupname: settings})
+
+    content['unsorted'] = None
+    output.append({'unsorted': None})
+    content['OUTPUT'] = output
+    content['UNWANTED'] = unwanted
+
+    with open(os.path.join(directory, 'groups.yml'), 'w') as fh:
+        yaml.safe_dump(content, fh)
+
+
+class ErrorCounter(logging.Handler):
+    """Count the errors logged, a broken fixture makes the timings useless."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class PhaseRecorder(object):
+    def __init__(self):
+        self.phases = {}
+
+    def run(self, name, function, *args):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.phases[name] = {
+            'seconds': round(duration, 4),
+            # libsolv allocates outside of the Python heap, so record the
+            # process high-water mark as well.
+            'python_peak_kb': python_peak // 1024,
+            'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        logging.info('%s took %f', name, duration)
+        return result
+
+
+def solve_modules(pkglist):
+    modules = []
+    for group in pkglist.output:
+        groupname = list(group)[0]
+        settings = group[groupname] or {}
+        pkglist.solve_module(groupname, settings.get('includes', []), settings.get('excludes', []),
+                             settings.get('recommends', True))
+        modules.append(pkglist.groups[groupname])
+    return modules
+
+
+def benchmark(directory, solvables, groups, seed):
+    rng = random.Random(seed)
+    names = generate_repositories(directory, solvables, rng)
+    generate_groups(directory, names, groups, rng)
+
+    pkglist = BenchmarkPkgListGen()
+    pkglist.input_dir = directory
+    pkglist.output_dir = directory
+    pkglist.repos = PROJECTS
+    pkglist.all_architectures = ARCHITECTURES
+    pkglist.use_newest_version = False
+    pkglist.filter_architectures(ARCHITECTURES)
+
+    recorder = PhaseRecorder()
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    # prepare_pool() reads the solv files relative to the working directory
+    cwd = os.getcwd()
+    original_repository_arch_state = tool.repository_arch_state
+    tool.repository_arch_state = repository_arch_state
+    os.chdir(directory)
+    try:
+        recorder.run('load_all_groups', pkglist.load_all_groups)
+        modules = recorder.run('solve_module', solve_modules, pkglist)
+        recorder.run('collect_unsorted_packages', pkglist._collect_unsorted_packages,
+                     modules, pkglist.groups.get('unsorted'))
+    finally:
+        os.chdir(cwd)
+        tool.repository_arch_state = original_repository_arch_state
+        logging.getLogger().removeHandler(errors)
+
+    if errors.count:
+        raise RuntimeError('{} errors logged while solving the generated groups'.format(errors.count))
+
+    return {
+        'parameters': {
+            'solvables': solvables,
+            'groups': groups,
+            'architectures': ARCHITECTURES,
+            'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'libsolv': solv_version(),
+            'machine': platform.machine(),
+        },
+        'phases': recorder.phases,
+    }
+
+
+def solv_version():
+    # the bindings do not expose the libsolv version, but the pip package of
+    # them is versioned like libsolv
+    try:
+        return importlib.metadata.version('solv')
+    except importlib.metadata.PackageNotFoundError:
+        pass
+
+    # distribution packages come without metadata
+    try:
+        p = subprocess.run(['rpm', '-q', '--qf', '%{VERSION}', 'libsolv-tools'],
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        if p.returncode == 0:
+            return p.stdout
+    except FileNotFoundError:
+        # no rpm on this system
+        pass
+
+    return getattr(solv, '__version__', 'unknown')
+
+
+def compare(baseline, result, tolerance):
+    regressions = []
+    for phase, current in result['phases'].items():
+        previous = baseline['phases'].get(phase)
+        if not previous:
+            continue
+        if current['seconds'] > previous['seconds'] * tolerance:
+            regressions.append('{}: {:.3f}s -> {:.3f}s'.format(phase, previous['seconds'], current['seconds']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pkglistgen solver on synthetic repositories')
+    parser.add_argument('--solvables', type=int, default=20000, help='number of solvables per architecture')
+    parser.add_argument('--groups', type=int, default=60, help='number of groups in the OUTPUT list')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the fixture generator')
+    parser.add_argument('--output', default='pkglistgen-benchmark.json', help='JSON file to store the results in')
+    parser.add_argument('--baseline', help='previous JSON result to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='allowed slowdown factor per phase before a regression is reported')
+    parser.add_argument('--keep', action='store_true', help='keep the generated fixtures')
+    parser.add_argument('-d', '--debug', action='store_true', help='enable debug information')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    directory = tempfile.mkdtemp(prefix='pkglistgen-benchmark-')
+    try:
+        result = benchmark(directory, args.solvables, args.groups, args.seed)
+    finally:
+        if args.keep:
+            logging.info('fixtures kept in %s', directory)
+        else:
+            shutil.rmtree(directory)
+
+    with open(args.output, 'w') as fh:
+        json.dump(result, fh, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(json.load(fh), result, args.tolerance)
+        for regression in regressions:
+            logging.error('regression in %s', regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import unittest
+
+# the script name is not a valid module name
+spec = importlib.util.spec_from_file_location(
+    'project_installcheck', os.path.join(os.path.dirname(__file__), '..', 'project-installcheck.py'))
+project_installcheck = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(project_installcheck)
+
+
+class TestReplaceFollowups(unittest.TestCase):
+    def replace_followups(self, outputs):
+        parsed = {package: {'output': output} for package, output in outputs.items()}
+        project_installcheck.RepoChecker()._replace_followups(parsed)
+        return {package: entry['output'] for package, entry in parsed.items()}
+
+    def test_followup(self):
+        result = self.replace_followups({
+            'a': ['nothing provides libx needed by a'],
+            'b': ['package b requires a, but none of the providers can be installed',
+                  'nothing provides libx needed by a'],
+            'c': ['nothing provides liby needed by c'],
+        })
+        self.assertEqual(result, {
+            'a': 'nothing provides libx needed by a',
+            'b': 'package b requires a, but none of the providers can be installed\nFOLLOWUP(a)',
+            'c': 'nothing provides liby needed by c',
+        })
+
+    def test_nested(self):
+        result = self.replace_followups({
+            'a': ['nothing provides libx needed by a'],
+            'b': ['package b requires a, but none of the providers can be installed',
+                  'nothing provides libx needed by a'],
+            'c': ['package c requires b, but none of the providers can be installed',
+                  'package b requires a, but none of the providers can be installed',
+                  'nothing provides libx needed by a'],
+        })
+        # the longest complete problem is preferred
+        self.assertEqual(result['b'], 'package b requires a, but none of the providers can be installed\nFOLLOWUP(a)')
+        self.assertEqual(result['c'], 'package c requires b, but none of the providers can be installed\nFOLLOWUP(b)')
+
+    def test_identical(self):
+        result = self.replace_followups({
+            'a': ['conflicting requests', 'nothing provides libx needed by a'],
+            'b': ['conflicting requests', 'nothing provides libx needed by a'],
+            'c': ['conflicting requests', 'nothing provides libx needed by a'],
+        })
+        # identical problems refer to the first package with that problem
+        self.assertEqual(result, {
+            'a': 'conflicting requests\nnothing provides libx needed by a',
+            'b': 'FOLLOWUP(a)',
+            'c': 'FOLLOWUP(a)',
+        })
+
+    def test_whole_lines(self):
+        result = self.replace_followups({
+            'a': ['nothing provides libx'],
+            'b': ['nothing provides libx needed by b'],
+            'c': ['package c requires b, but none of the providers can be installed',
+                  'nothing provides libx needed by b',
+                  'nothing provides libx'],
+        })
+        # blocks only match whole lines, not the prefix of a line
+        self.assertEqual(result['b'], 'nothing provides libx needed by b')
+        self.assertEqual(result['c'],
+                         'package c requires b, but none of the providers can be installed\nFOLLOWUP(b)\nFOLLOWUP(a)')
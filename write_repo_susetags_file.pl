@@ -2,6 +2,7 @@
 
 use strict;
 use File::Basename;
+use Storable qw(nstore retrieve);
 
 BEGIN {
     my ($wd) = $0 =~ m-(.*)/-;
@@ -16,8 +17,29 @@ die "Usage: $0 <output directory> <input directories...>" if scalar(@ARGV) < 2;
 my $output_directory = shift @ARGV;
 my @directories      = @ARGV;
 
+# The snippets of all rpms of a directory are kept in a single file next to
+# the per rpm cache of CreatePackageDescr, so unchanged directories do not
+# need to open every rpm or its cache file.
+sub directory_cache_load {
+    my ($directory) = @_;
+
+    my $cachefile = "$directory/.cache/packages-2";
+    return {} unless -f $cachefile;
+    my $cache = eval { retrieve($cachefile) };
+    return $cache || {};
+}
+
+sub directory_cache_store {
+    my ($directory, $cache) = @_;
+
+    mkdir("$directory/.cache");
+    my $cachefile = "$directory/.cache/packages-2";
+    nstore($cache, "$cachefile.$$") || die "can't store $cachefile";
+    rename("$cachefile.$$", $cachefile) || die "can't rename $cachefile";
+}
+
 sub write_package {
-    my ($package, $packages_fd, $directory, $written_names, $sources) = @_;
+    my ($package, $packages_fd, $directory, $written_names, $sources, $cache, $cached) = @_;
 
     my $name = basename($package);
     if ($name =~ m/^[a-z0-9]{32}-/) {    # repo cache
@@ -31,11 +53,19 @@ sub write_package {
     }
     $written_names->{$name} = $directory;
 
-    my $out = CreatePackageDescr::package_snippet($package);
+    my $size  = -s $package;
+    my $entry = $cached->{basename($package)};
+    my $out;
+    if ($entry && $entry->{size} == $size) {
+        $out = $entry->{snippet};
+    } else {
+        $out = CreatePackageDescr::package_snippet($package);
+    }
     if ($out eq "" || $out =~ m/=Pkg:    /) {
         print STDERR "ERROR: empty package snippet for: $name\n";
         exit(126);
     }
+    $cache->{basename($package)} = {size => $size, snippet => $out};
     if ($out =~ m/=Src: ([^ ]*)/) {
         $sources->{$name} = $1;
     }
@@ -50,8 +80,25 @@ my %written_names;
 my %sources;
 
 for my $directory (@directories) {
-    my @rpms = glob("$directory/*.rpm");
-    write_package($_, $packages_fd, $directory, \%written_names, \%sources) for @rpms;
+    my @rpms   = glob("$directory/*.rpm");
+    my $cached = directory_cache_load($directory);
+    my %cache;
+    write_package($_, $packages_fd, $directory, \%written_names, \%sources, \%cache, $cached) for @rpms;
+
+    # keep snippets of rpms shadowed by earlier directories
+    for my $rpm (@rpms) {
+        my $base = basename($rpm);
+        $cache{$base} ||= $cached->{$base} if $cached->{$base};
+    }
+
+    my $changed = scalar(keys %cache) != scalar(keys %$cached);
+    for my $base (keys %cache) {
+        $changed ||= !$cached->{$base} || $cached->{$base}->{snippet} ne $cache{$base}->{snippet};
+    }
+    directory_cache_store($directory, \%cache) if $changed;
+
+    # mark as used like package_snippet() does to avoid the cache pruning
+    utime undef, undef, @rpms;
 }
 
 close($packages_fd);